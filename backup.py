@@ -0,0 +1,94 @@
+"""Exports or restores one server's data straight from the database, without the bot running.
+
+    python backup.py export 123456789012345678                  # mmi-<guild>.jsonl
+    python backup.py export 123456789012345678 --format csv     # one mmi-<guild>-<table>.csv per table
+    python backup.py restore mmi-123456789012345678.jsonl
+
+A restore replaces everything stored for the server in the backup. Restart the bot afterwards,
+or use /backup restore instead, so its caches pick up the restored data.
+"""
+
+from __future__ import annotations
+import argparse
+import asyncio
+import sys
+from typing import List, Optional
+
+import asyncpg
+from utils.backup import (
+    TABLES,
+    BackupError,
+    export_guild,
+    export_guild_csv,
+    read_header,
+    restore_guild,
+)
+from utils.config import load_config
+
+
+async def export(dsn: str, guild_id: int, format: str, output: Optional[str]) -> None:
+    con = await asyncpg.connect(dsn)
+    try:
+        if format == "jsonl":
+            path = output or f"mmi-{guild_id}.jsonl"
+            with open(path, "wb") as f:
+                await export_guild(con, guild_id, f)
+            print(f"Wrote {path}")
+            return
+        prefix = output or f"mmi-{guild_id}"
+        files = {
+            table.name: open(f"{prefix}-{table.name}.csv", "wb") for table in TABLES
+        }
+        try:
+            await export_guild_csv(con, guild_id, files)
+        finally:
+            for f in files.values():
+                f.close()
+        print(f"Wrote {', '.join(f.name for f in files.values())}")
+    finally:
+        await con.close()
+
+
+async def restore(dsn: str, path: str) -> None:
+    with open(path, "rb") as source:
+        guild_id = read_header(source)["guild_id"]
+        con = await asyncpg.connect(dsn)
+        try:
+            counts = await restore_guild(con, guild_id, source)
+        finally:
+            await con.close()
+    print(
+        f"Restored guild {guild_id}: "
+        + ", ".join(f"{count} {table}" for table, count in counts.items())
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Export a server's data")
+    export_parser.add_argument("guild_id", type=int)
+    export_parser.add_argument("--format", choices=("jsonl", "csv"), default="jsonl")
+    export_parser.add_argument(
+        "-o", "--output", help="File to write, or the file name prefix for csv"
+    )
+    restore_parser = commands.add_parser(
+        "restore", help="Replace a server's data with a jsonl backup"
+    )
+    restore_parser.add_argument("path")
+    args = parser.parse_args(argv)
+
+    config = load_config()
+    try:
+        if args.command == "export":
+            asyncio.run(export(config.db, args.guild_id, args.format, args.output))
+        else:
+            asyncio.run(restore(config.db, args.path))
+    except BackupError as e:
+        print(e)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+"""Minimal stand-ins for the discord.py objects the topic handlers touch."""
+
+from __future__ import annotations
+import asyncio
+import discord
+import itertools
+import logging
+from typing import Any, Dict, List, Optional
+
+from utils.cache import SettingsCache, TopicChoices
+from utils.topics import TopicRepository
+from utils.leaderboard import LeaderboardManager
+from utils.outbound import OutboundScheduler
+
+_snowflakes = itertools.count(1_100_000_000_000_000_000)
+
+
+def snowflake() -> int:
+    return next(_snowflakes)
+
+
+class DiscordLatency:
+    """Simulated round-trip time for REST calls, shared by all fakes"""
+
+    seconds = 0.0
+    calls = 0
+
+    @classmethod
+    async def wait(cls) -> None:
+        cls.calls += 1
+        if cls.seconds:
+            await asyncio.sleep(cls.seconds)
+
+
+class FakeResponse:
+    def __init__(self) -> None:
+        self.modal = None
+        self.messages: List[str] = []
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def send_message(self, content: str = None, **kwargs: Any) -> None:
+        await DiscordLatency.wait()
+        self._done = True
+        self.messages.append(content)
+
+    async def send_modal(self, modal: Any) -> None:
+        await DiscordLatency.wait()
+        self._done = True
+        self.modal = modal
+
+    async def defer(self, **kwargs: Any) -> None:
+        await DiscordLatency.wait()
+        self._done = True
+
+
+class FakeFollowup:
+    def __init__(self) -> None:
+        self.messages: List[str] = []
+
+    async def send(self, content: str = None, **kwargs: Any) -> None:
+        await DiscordLatency.wait()
+        self.messages.append(content)
+
+
+class FakeMessage:
+    def __init__(self, id: int, channel: FakeThread) -> None:
+        self.id = id
+        self.channel = channel
+
+    async def pin(self) -> None:
+        await DiscordLatency.wait()
+
+    async def edit(self, **kwargs: Any) -> FakeMessage:
+        await DiscordLatency.wait()
+        return self
+
+    async def reply(self, content: str = None, **kwargs: Any) -> FakeMessage:
+        await DiscordLatency.wait()
+        return FakeMessage(snowflake(), self.channel)
+
+
+class FakeThread:
+    # Passes isinstance checks against discord.Thread, the same way mock's spec does
+    __class__ = property(lambda self: discord.Thread)
+
+    def __init__(self, id: int, name: str, parent: FakeForum) -> None:
+        self.id = id
+        self.name = name
+        self.parent = parent
+        self.parent_id = parent.id
+        self.guild = parent.guild
+        self.mention = f"<#{id}>"
+
+    def get_partial_message(self, message_id: int) -> FakeMessage:
+        return FakeMessage(message_id, self)
+
+    async def edit(self, **kwargs: Any) -> FakeThread:
+        await DiscordLatency.wait()
+        self.name = kwargs.get("name", self.name)
+        return self
+
+    async def send(self, content: str = None, **kwargs: Any) -> FakeMessage:
+        await DiscordLatency.wait()
+        return FakeMessage(snowflake(), self)
+
+
+class FakeForum:
+    def __init__(self, guild: FakeGuild) -> None:
+        self.id = snowflake()
+        self.guild = guild
+        self.threads: List[FakeThread] = []
+        self.mention = f"<#{self.id}>"
+
+    async def create_thread(
+        self, *, name: str, content: str, view: Any = None
+    ) -> tuple:
+        await DiscordLatency.wait()
+        thread = FakeThread(snowflake(), name, self)
+        self.threads.append(thread)
+        self.guild.channels[thread.id] = thread
+        return thread, FakeMessage(snowflake(), thread)
+
+
+class FakeRole:
+    def __init__(self) -> None:
+        self.id = snowflake()
+        self.name = f"role-{self.id}"
+
+
+class FakePermissions:
+    def __init__(self, administrator: bool) -> None:
+        self.administrator = administrator
+
+
+class FakeMember:
+    def __init__(self, roles: List[FakeRole], administrator: bool = False) -> None:
+        self.id = snowflake()
+        self.roles = roles
+        self._roles = {r.id: r for r in roles}
+        self.guild_permissions = FakePermissions(administrator)
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        return self._roles.get(role_id)
+
+
+class FakeGuild:
+    def __init__(self) -> None:
+        self.id = snowflake()
+        self.name = f"guild-{self.id}"
+        self.channels: Dict[int, Any] = {}
+        self.roles: Dict[int, FakeRole] = {}
+        self.forum = FakeForum(self)
+        self.channels[self.forum.id] = self.forum
+        self.topic_role = FakeRole()
+        self.roles[self.topic_role.id] = self.topic_role
+
+    def get_channel(self, channel_id: Optional[int]) -> Any:
+        return self.channels.get(channel_id)
+
+    get_channel_or_thread = get_channel
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        return self.roles.get(role_id)
+
+    async def fetch_channel(self, channel_id: int) -> Any:
+        await DiscordLatency.wait()
+        return self.channels[channel_id]
+
+
+class FakeInteraction:
+    def __init__(
+        self,
+        client: FakeBot,
+        guild: FakeGuild,
+        user: FakeMember,
+        channel: Any = None,
+        message: FakeMessage = None,
+    ) -> None:
+        self.id = snowflake()
+        self.client = client
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = user
+        self.channel = channel
+        self.message = message
+        self.command = None
+        self.permissions = user.guild_permissions
+        self.extras: Dict[Any, Any] = {}
+        self.response = FakeResponse()
+        self.followup = FakeFollowup()
+
+
+class FakeBot:
+    """The parts of ModMailInternal the handlers use, wired to a given pool"""
+
+    def __init__(self, db: Any) -> None:
+        self.db = db
+        self.log = logging.getLogger("benchmarks")
+        self.view_mode = "dynamic"
+        self.votes = None
+        self.guilds: Dict[int, FakeGuild] = {}
+        self.settings_cache = SettingsCache(self)
+        self.topic_choices = TopicChoices(self, 30.0)
+        self.topics = TopicRepository(self)
+        self.outbound = OutboundScheduler(self.log)
+        self.leaderboards = LeaderboardManager(self, 0, 25)
+
+    def get_guild(self, guild_id: int) -> Optional[FakeGuild]:
+        return self.guilds.get(guild_id)
+
+    async def drain(self) -> None:
+        """Waits for queued outbound calls and leaderboard renders to finish"""
+        while self.outbound._buckets or self.leaderboards._renders:
+            await asyncio.sleep(0)
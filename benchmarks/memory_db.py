@@ -0,0 +1,232 @@
+"""An in-memory stand-in for the asyncpg pool, just enough of it to drive the topic handlers.
+
+Queries are routed by the text of the `utils.queries` statement they run, which `utils.db.Database` passes through.
+An unknown statement raises, so a handler that starts issuing a new query has to be taught here first.
+"""
+
+from __future__ import annotations
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+from utils import queries
+
+
+class Record(tuple):
+    """Tuple that can also be indexed by column name, like asyncpg.Record"""
+
+    def __new__(cls, **columns: Any) -> Record:
+        record = super().__new__(cls, columns.values())
+        record._columns = columns
+        return record
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._columns[key]
+        return super().__getitem__(key)
+
+
+class MemoryDB:
+    """Pool and connection stand-in that keeps the tables in dicts"""
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.settings: Dict[int, Dict[str, Any]] = {}
+        self.topics: Dict[int, Dict[str, Any]] = {}
+        self.votes: Set[Tuple[int, int]] = set()
+        self.archive: List[Dict[str, Any]] = []
+        self._routes: Dict[str, Callable[..., Any]] = {
+            statement.sql: handler
+            for statement, handler in (
+                (queries.SETTINGS_GET, self._settings_get),
+                (queries.SETTINGS_ENSURE, self._settings_insert),
+                (queries.TOPIC_CREATE, self._topic_insert),
+                (queries.VOTE_ADD, self._vote_add),
+                (queries.VOTE_REMOVE, self._vote_remove),
+                (queries.TOPICS_RANKING, self._topics_by_guild),
+                (queries.TOPIC_CHOICES_BY_AUTHOR, self._choices_by_author),
+                (queries.TOPIC_ID_BY_MESSAGE, self._topic_id_by_message),
+                (queries.TOPIC_BY_THREAD, self._topic_by_thread),
+                (queries.TOPIC_GET, self._topic_get),
+                (queries.VOTERS, self._voters),
+                (queries.TOPIC_UPDATE, self._topic_update),
+                (queries.TOPIC_ARCHIVE, self._topic_archive),
+            )
+        }
+
+    async def _run(self, query: str, args: Tuple[Any, ...]) -> Any:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        handler = self._routes.get(query)
+        if handler is None:
+            raise KeyError(f"MemoryDB has no route for: {query}")
+        return handler(*args)
+
+    # Pool/connection API
+    async def fetch(self, query: str, *args: Any) -> List[Record]:
+        return await self._run(query, args) or []
+
+    async def fetchrow(self, query: str, *args: Any) -> Optional[Record]:
+        result = await self._run(query, args)
+        if isinstance(result, list):
+            return result[0] if result else None
+        return result
+
+    async def fetchval(self, query: str, *args: Any) -> Any:
+        result = await self.fetchrow(query, *args)
+        if isinstance(result, Record):
+            return result[0]
+        return result
+
+    async def execute(self, query: str, *args: Any) -> str:
+        await self._run(query, args)
+        return "OK"
+
+    async def executemany(self, query: str, args: List[Tuple[Any, ...]]) -> None:
+        for arg in args:
+            await self._run(query, arg)
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[MemoryDB]:
+        yield self
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[None]:
+        yield
+
+    def get_size(self) -> int:
+        return 1
+
+    def get_idle_size(self) -> int:
+        return 1
+
+    def get_max_size(self) -> int:
+        return 1
+
+    # Routes
+    def _settings_get(self, guild_id):
+        row = self.settings.get(guild_id)
+        return Record(**row) if row else None
+
+    def _settings_insert(self, guild_id):
+        self.settings.setdefault(
+            guild_id,
+            dict(
+                guild_id=guild_id,
+                output_channel_id=None,
+                allowed_role_ids=None,
+                priority_counting_thread=None,
+                priority_message_id=None,
+            ),
+        )
+
+    def _topic_insert(
+        self,
+        id,
+        guild_id,
+        title,
+        message,
+        priority,
+        message_id,
+        author_id,
+        thread_id,
+    ):
+        self.topics[id] = dict(
+            id=id,
+            guild_id=guild_id,
+            title=title,
+            message=message,
+            priority_level=priority,
+            message_id=message_id,
+            author_id=author_id,
+            thread_id=thread_id,
+        )
+        self.votes.add((id, author_id))
+
+    def _vote_add(self, topic_id, user_id):
+        if (topic_id, user_id) in self.votes:
+            return None
+        self.votes.add((topic_id, user_id))
+        self.topics[topic_id]["priority_level"] += 1
+        return self.topics[topic_id]["priority_level"]
+
+    def _vote_remove(self, topic_id, user_id):
+        if topic_id not in self.topics:
+            return Record(topic_exists=False, priority_level=None)
+        if (topic_id, user_id) not in self.votes:
+            return Record(topic_exists=True, priority_level=None)
+        self.votes.discard((topic_id, user_id))
+        self.topics[topic_id]["priority_level"] -= 1
+        return Record(
+            topic_exists=True, priority_level=self.topics[topic_id]["priority_level"]
+        )
+
+    def _topics_by_guild(self, guild_id):
+        return [
+            Record(
+                id=t["id"], thread_id=t["thread_id"], priority_level=t["priority_level"]
+            )
+            for t in self.topics.values()
+            if t["guild_id"] == guild_id
+        ]
+
+    def _choices_by_author(self, guild_id, author_id, limit):
+        topics = sorted(
+            (
+                t
+                for t in self.topics.values()
+                if t["guild_id"] == guild_id and t["author_id"] == author_id
+            ),
+            key=lambda t: -t["priority_level"],
+        )
+        return [
+            Record(thread_id=t["thread_id"], title=t["title"]) for t in topics[:limit]
+        ]
+
+    def _find(self, column: str, value: Any) -> Optional[Dict[str, Any]]:
+        return next((t for t in self.topics.values() if t[column] == value), None)
+
+    def _topic_id_by_message(self, message_id):
+        topic = self._find("message_id", message_id)
+        return topic and topic["id"]
+
+    def _topic_by_thread(self, guild_id, thread_id):
+        return self._topic_row(self._find("thread_id", thread_id))
+
+    def _topic_get(self, topic_id):
+        return self._topic_row(self.topics.get(topic_id))
+
+    def _topic_row(self, topic):
+        if topic is None:
+            return None
+        return Record(
+            **{k: v for k, v in topic.items() if k not in ("priority_level", "search")}
+        )
+
+    def _voters(self, topic_id):
+        if topic_id not in self.topics:
+            return None
+        return Record(voter_ids=[u for t, u in self.votes if t == topic_id])
+
+    def _topic_update(self, topic_id, title, message):
+        topic = self.topics[topic_id]
+        topic["title"] = title or topic["title"]
+        topic["message"] = message or topic["message"]
+
+    def _topic_archive(self, topic_id, guild_id, closed_by, closer_id, remarks):
+        topic = self.topics.pop(topic_id, None)
+        if topic is None:
+            return None
+        voters = [u for t, u in self.votes if t == topic_id]
+        self.votes = {v for v in self.votes if v[0] != topic_id}
+        self.archive.append(
+            dict(
+                topic,
+                voter_ids=voters,
+                closed_by=closed_by,
+                closer_id=closer_id,
+                remarks=remarks,
+            )
+        )
+        return Record(
+            priority_level=topic["priority_level"], message_id=topic["message_id"]
+        )
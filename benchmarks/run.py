@@ -0,0 +1,339 @@
+"""Offline benchmarks for the topic commands, buttons and checks.
+
+Run from the repository root:
+
+    python -m benchmarks.run                         # in-memory database stand-in
+    python -m benchmarks.run --dsn postgres://...    # a real (scratch) Postgres database
+    python -m benchmarks.run --save baseline.json
+    python -m benchmarks.run --baseline baseline.json --tolerance 0.25
+
+With --baseline the exit code is 1 if any handler got slower than the tolerance allows or makes more database round-trips.
+"""
+
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+from benchmarks.fakes import (
+    DiscordLatency,
+    FakeBot,
+    FakeGuild,
+    FakeInteraction,
+    FakeMember,
+)
+from benchmarks.memory_db import MemoryDB
+from cogs.topic import Topic
+from utils.db import Database
+from utils.metrics import Metrics
+from utils.ui import add_priority, remove_priority
+
+
+class Environment:
+    """A guild with a forum, a whitelisted role and a topic everyone votes on"""
+
+    def __init__(self, db: Database) -> None:
+        self.db = db
+        self.bot = FakeBot(db)
+        self.guild = FakeGuild()
+        self.bot.guilds[self.guild.id] = self.guild
+        self.cog = Topic(self.bot)
+        self.member = FakeMember([self.guild.topic_role])
+        self.hot_topic: int
+
+    def interaction(self, user: FakeMember = None, **kwargs: Any) -> FakeInteraction:
+        return FakeInteraction(self.bot, self.guild, user or self.member, **kwargs)
+
+    async def seed(self) -> None:
+        if isinstance(self.db.pool, MemoryDB):
+            self.db.pool.settings[self.guild.id] = dict(
+                guild_id=self.guild.id,
+                output_channel_id=self.guild.forum.id,
+                allowed_role_ids=[self.guild.topic_role.id],
+                priority_counting_thread=None,
+                priority_message_id=None,
+            )
+        else:
+            await self.db.execute(
+                "INSERT INTO settings (guild_id, output_channel_id, allowed_role_ids) VALUES ($1, $2, $3)",
+                self.guild.id,
+                self.guild.forum.id,
+                [self.guild.topic_role.id],
+            )
+        _, self.hot_topic = await self.create_topic(self.member)
+
+    async def create_topic(self, author: FakeMember) -> tuple:
+        interaction = self.interaction(author)
+        await self.cog.create_topic.callback(
+            self.cog, interaction, "Benchmark topic", "Benchmark description"
+        )
+        await self.bot.drain()
+        return self.guild.forum.threads[-1], interaction.id
+
+    async def cleanup(self) -> None:
+        if not isinstance(self.db.pool, MemoryDB):
+            await self.db.execute(
+                "DELETE FROM topics WHERE guild_id = $1", self.guild.id
+            )
+            await self.db.execute(
+                "DELETE FROM topics_archive WHERE guild_id = $1", self.guild.id
+            )
+            await self.db.execute(
+                "DELETE FROM settings WHERE guild_id = $1", self.guild.id
+            )
+
+
+class Scenario(ABC):
+    """One handler to benchmark. `prepare` does untimed setup for a call, `run` is the timed part"""
+
+    name: str
+
+    async def prepare(self, env: Environment) -> Any:
+        return env.interaction()
+
+    @abstractmethod
+    async def run(self, env: Environment, state: Any) -> None: ...
+
+
+class TopicWhitelist(Scenario):
+    name = "checks.topic_whitelist"
+
+    async def run(self, env: Environment, interaction: FakeInteraction) -> None:
+        for check in env.cog.create_topic.checks:
+            await check(interaction)
+
+
+class CreateTopic(Scenario):
+    name = "Topic.create_topic"
+
+    async def run(self, env: Environment, interaction: FakeInteraction) -> None:
+        await env.cog.create_topic.callback(
+            env.cog, interaction, "Benchmark topic", "Benchmark description"
+        )
+
+
+class AddPriority(Scenario):
+    name = "TopicView.add_priority"
+
+    async def prepare(self, env: Environment) -> FakeInteraction:
+        return env.interaction(FakeMember([env.guild.topic_role]))
+
+    async def run(self, env: Environment, interaction: FakeInteraction) -> None:
+        await add_priority(env.bot, interaction, env.hot_topic)
+
+
+class RemovePriority(Scenario):
+    name = "TopicView.remove_priority"
+
+    async def prepare(self, env: Environment) -> FakeInteraction:
+        voter = FakeMember([env.guild.topic_role])
+        await add_priority(env.bot, env.interaction(voter), env.hot_topic)
+        return env.interaction(voter)
+
+    async def run(self, env: Environment, interaction: FakeInteraction) -> None:
+        await remove_priority(env.bot, interaction, env.hot_topic)
+
+
+class EditTopic(Scenario):
+    name = "Topic.edit_topic"
+
+    async def prepare(self, env: Environment) -> tuple:
+        author = FakeMember([env.guild.topic_role])
+        thread, _ = await env.create_topic(author)
+        return env.interaction(author, channel=thread), thread
+
+    async def run(self, env: Environment, state: tuple) -> None:
+        interaction, thread = state
+        await env.cog.edit_topic.callback(env.cog, interaction, str(thread.id))
+        modal = interaction.response.modal
+        submit = env.interaction(interaction.user, channel=thread)
+        modal.topic_title._refresh_state(submit, {"value": "Edited title"})
+        modal.topic_message._refresh_state(submit, {"value": "Edited description"})
+        await modal.on_submit(submit)
+
+
+class CloseTopic(Scenario):
+    name = "Topic.close_topic"
+
+    async def prepare(self, env: Environment) -> tuple:
+        author = FakeMember([env.guild.topic_role])
+        thread, _ = await env.create_topic(author)
+        return env.interaction(author, channel=thread), thread
+
+    async def run(self, env: Environment, state: tuple) -> None:
+        interaction, thread = state
+        await env.cog.close_topic.callback(env.cog, interaction, str(thread.id))
+        modal = interaction.response.modal
+        submit = env.interaction(interaction.user, channel=thread)
+        modal.conclusion_text._refresh_state(submit, {"value": "Benchmark closed"})
+        await modal.on_submit(submit)
+
+
+class ThreadAutocomplete(Scenario):
+    name = "Topic.edit_topic_autocomplete"
+
+    async def prepare(self, env: Environment) -> FakeInteraction:
+        return env.interaction()
+
+    async def run(self, env: Environment, interaction: FakeInteraction) -> None:
+        await env.cog.edit_topic_autocomplete(interaction, "bench")
+
+
+SCENARIOS: List[Scenario] = [
+    TopicWhitelist(),
+    CreateTopic(),
+    AddPriority(),
+    RemovePriority(),
+    EditTopic(),
+    CloseTopic(),
+    ThreadAutocomplete(),
+]
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+async def measure(
+    env: Environment, scenario: Scenario, iterations: int, concurrency: int
+) -> Dict[str, float]:
+    # Round-trips per call, measured alone so concurrent calls don't mix their counts
+    state = await scenario.prepare(env)
+    await env.bot.drain()
+    db_before, discord_before = env.db.round_trips, DiscordLatency.calls
+    await scenario.run(env, state)
+    await env.bot.drain()
+    round_trips = env.db.round_trips - db_before
+    discord_calls = DiscordLatency.calls - discord_before
+
+    states = [await scenario.prepare(env) for _ in range(iterations)]
+    await env.bot.drain()
+    latencies: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(state: Any) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            await scenario.run(env, state)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(call(s) for s in states))
+    elapsed = time.perf_counter() - start
+    await env.bot.drain()
+
+    return {
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "db_round_trips": round_trips,
+        "discord_calls": discord_calls,
+        "throughput": iterations / elapsed,
+    }
+
+
+def compare(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    tolerance: float,
+) -> List[str]:
+    """Lists every regression against the baseline"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p95 {result['p95_ms']:.3f}ms vs {base['p95_ms']:.3f}ms"
+            )
+        if result["db_round_trips"] > base["db_round_trips"]:
+            regressions.append(
+                f"{name}: {result['db_round_trips']} round-trips vs {base['db_round_trips']}"
+            )
+    return regressions
+
+
+async def main(args: argparse.Namespace) -> int:
+    DiscordLatency.seconds = args.discord_latency / 1000
+    if args.dsn:
+        from utils.db import create_pool
+        from utils.migrations import run_migrations
+
+        pool = await create_pool(args.dsn)
+        async with pool.acquire() as con:
+            await run_migrations(con, logging.getLogger("benchmarks"))
+    else:
+        pool = MemoryDB(args.db_latency / 1000)
+    # Only the pool wait histogram of the metrics is used here
+    db = Database(pool, Metrics(None))
+
+    results: Dict[str, Dict[str, float]] = {}
+    try:
+        for scenario in SCENARIOS:
+            if args.only and scenario.name not in args.only:
+                continue
+            for concurrency in args.concurrency:
+                env = Environment(db)
+                await env.seed()
+                try:
+                    result = await measure(env, scenario, args.iterations, concurrency)
+                finally:
+                    await env.cleanup()
+                key = f"{scenario.name}@{concurrency}"
+                results[key] = result
+                print(
+                    f"{key:<34} p50 {result['p50_ms']:8.3f}ms  p95 {result['p95_ms']:8.3f}ms  "
+                    f"p99 {result['p99_ms']:8.3f}ms  db {result['db_round_trips']:>2}  "
+                    f"discord {result['discord_calls']:>2}  {result['throughput']:9.1f}/s"
+                )
+    finally:
+        if args.dsn:
+            await pool.close()
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        return 1 if regressions else 0
+    return 0
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dsn", help="Postgres to run against instead of the stand-in")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument(
+        "--concurrency",
+        type=lambda s: [int(c) for c in s.split(",")],
+        default=[1, 25],
+        help="Comma separated numbers of simulated concurrent users",
+    )
+    parser.add_argument(
+        "--db-latency", type=float, default=0.5, help="Stand-in round-trip time in ms"
+    )
+    parser.add_argument(
+        "--discord-latency", type=float, default=0.0, help="Simulated REST time in ms"
+    )
+    parser.add_argument("--only", nargs="*", help="Scenario names to run")
+    parser.add_argument("--save", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(asyncio.run(main(parse_args())))
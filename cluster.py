@@ -0,0 +1,136 @@
+"""Runs the bot as several processes, each owning a range of shards.
+
+    python cluster.py                 # cluster_count and shard_count from the config
+    python cluster.py --clusters 4 --shards 16
+
+Without a shard count Discord's recommended count is used. Crashed workers are restarted,
+SIGHUP is passed on to every worker so they reload their config, SIGINT and SIGTERM stop them all.
+"""
+
+from __future__ import annotations
+import argparse
+import asyncio
+import math
+import multiprocessing
+import os
+import signal
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+from utils.cluster import ClusterInfo, plan_clusters
+from utils.config import load_config
+
+GATEWAY_URL = "https://discord.com/api/v10/gateway/bot"
+# Discord allows max_concurrency shards to identify every 5 seconds
+IDENTIFY_WINDOW = 5.0
+RESTART_DELAY = 5.0
+
+
+async def fetch_gateway(token: str) -> Tuple[int, int]:
+    """Gets the recommended shard count and the identify concurrency for the bot"""
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            GATEWAY_URL, headers={"Authorization": f"Bot {token}"}
+        ) as response:
+            response.raise_for_status()
+            data = await response.json()
+    return data["shards"], data["session_start_limit"]["max_concurrency"]
+
+
+def run_worker(cluster: ClusterInfo) -> None:
+    """Entry point of a worker process"""
+    os.environ.update(cluster.to_env())
+    # main builds the bot on import, so the cluster has to be in the environment first
+    import main
+
+    asyncio.run(main.main())
+
+
+class Launcher:
+    def __init__(self, clusters: List[ClusterInfo], max_concurrency: int) -> None:
+        self.clusters = clusters
+        self.max_concurrency = max_concurrency
+        self.context = multiprocessing.get_context("spawn")
+        self.processes: Dict[int, multiprocessing.Process] = {}
+        self.stopping = False
+
+    def start(self, cluster: ClusterInfo) -> None:
+        process = self.context.Process(
+            target=run_worker, args=(cluster,), name=f"cluster-{cluster.cluster_id}"
+        )
+        process.start()
+        self.processes[cluster.cluster_id] = process
+        print(
+            f"Cluster {cluster.cluster_id} started (pid {process.pid}) "
+            f"with shards {cluster.shard_ids[0]}-{cluster.shard_ids[-1]}"
+        )
+
+    def start_all(self) -> None:
+        for cluster in self.clusters:
+            if self.stopping:
+                return
+            if cluster.cluster_id:
+                # Give the previous cluster's shards time to identify first
+                previous = self.clusters[cluster.cluster_id - 1]
+                time.sleep(
+                    math.ceil(len(previous.shard_ids) / self.max_concurrency)
+                    * IDENTIFY_WINDOW
+                )
+            self.start(cluster)
+
+    def signal_all(self, signum: int) -> None:
+        for process in self.processes.values():
+            if process.is_alive():
+                os.kill(process.pid, signum)
+
+    def stop(self, signum: int, frame: Optional[object] = None) -> None:
+        self.stopping = True
+        self.signal_all(signal.SIGTERM)
+
+    def supervise(self) -> None:
+        """Restarts workers that exit on their own until the launcher is stopped"""
+        while not self.stopping:
+            time.sleep(1)
+            for cluster in self.clusters:
+                process = self.processes.get(cluster.cluster_id)
+                if process is None or process.is_alive() or self.stopping:
+                    continue
+                print(
+                    f"Cluster {cluster.cluster_id} exited with {process.exitcode}, "
+                    f"restarting in {RESTART_DELAY:.0f}s"
+                )
+                time.sleep(RESTART_DELAY)
+                # A stop during the delay has already signalled every worker, a new one would be left running
+                if self.stopping:
+                    break
+                self.start(cluster)
+        for process in self.processes.values():
+            process.join()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clusters", type=int, help="Number of worker processes")
+    parser.add_argument("--shards", type=int, help="Total number of shards")
+    args = parser.parse_args(argv)
+
+    config = load_config()
+    shard_count, max_concurrency = asyncio.run(fetch_gateway(config.token))
+    shard_count = args.shards or config.shard_count or shard_count
+    clusters = plan_clusters(shard_count, args.clusters or config.cluster_count)
+    print(f"Running {shard_count} shards on {len(clusters)} clusters")
+
+    launcher = Launcher(clusters, max_concurrency)
+    signal.signal(signal.SIGINT, launcher.stop)
+    signal.signal(signal.SIGTERM, launcher.stop)
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, lambda *_: launcher.signal_all(signal.SIGHUP))
+    launcher.start_all()
+    launcher.supervise()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+from __future__ import annotations
+import aiohttp
+import discord
+from discord import app_commands
+from discord.ext import commands
+from tempfile import TemporaryFile
+from utils.backup import (
+    TABLES,
+    BackupError,
+    export_guild,
+    export_guild_csv,
+    read_header,
+    restore_guild,
+)
+from utils.common import configure_logging
+from utils.ui import recreate_views
+from typing import IO, TYPE_CHECKING, Literal
+
+if TYPE_CHECKING:
+    from main import ModMailInternal
+
+DOWNLOAD_CHUNK_SIZE = 64 * 2**10
+
+
+@app_commands.guild_only()
+@app_commands.default_permissions(administrator=True)
+class Backup(
+    commands.GroupCog,
+    name="backup",
+    description="Used to back up and restore this server's topics and settings",
+):
+    """Cog for exporting and restoring a guild's data"""
+
+    def __init__(self, bot: ModMailInternal) -> None:
+        self.bot = bot
+        self.log = configure_logging("backup")
+        super().__init__()
+
+    @app_commands.command(name="export")
+    @app_commands.describe(
+        format="jsonl can be restored with /backup restore, csv is for reading in a spreadsheet"
+    )
+    async def backup_export(
+        self,
+        interaction: discord.Interaction,
+        format: Literal["jsonl", "csv"] = "jsonl",
+    ):
+        """Exports this server's settings, topics, votes and closed topics"""
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        guild_id = interaction.guild_id
+        if self.bot.votes is not None:
+            await self.bot.votes.flush()
+
+        if format == "jsonl":
+            # Real files, on Python 3.10 discord.File tries to open() a SpooledTemporaryFile as a path
+            outputs = {"jsonl": TemporaryFile()}
+        else:
+            outputs = {table.name: TemporaryFile() for table in TABLES}
+        try:
+            async with self.bot.db.acquire() as con:
+                if format == "jsonl":
+                    await export_guild(con, guild_id, outputs["jsonl"])
+                else:
+                    await export_guild_csv(con, guild_id, outputs)
+            size = sum(output.tell() for output in outputs.values())
+            if size > interaction.guild.filesize_limit:
+                await interaction.followup.send(
+                    f"The export is {size / 2**20:.1f} MiB, too large to upload here. "
+                    f"Run `python backup.py export {guild_id}` on the bot's host instead.",
+                    ephemeral=True,
+                )
+                return
+            files = []
+            for name, output in outputs.items():
+                output.seek(0)
+                filename = (
+                    f"mmi-{guild_id}.jsonl"
+                    if format == "jsonl"
+                    else f"mmi-{guild_id}-{name}.csv"
+                )
+                files.append(discord.File(output, filename=filename))
+            await interaction.followup.send(
+                "Here is this server's backup.", files=files, ephemeral=True
+            )
+        finally:
+            for output in outputs.values():
+                output.close()
+        self.log.info(f"Exported guild {guild_id} as {format} ({size} bytes)")
+
+    @app_commands.command(name="restore")
+    @app_commands.describe(
+        backup="A .jsonl file made by /backup export, it replaces everything stored for this server"
+    )
+    async def backup_restore(
+        self, interaction: discord.Interaction, backup: discord.Attachment
+    ):
+        """Replaces this server's settings and topics with the contents of a backup"""
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        guild_id = interaction.guild_id
+        with await self.download(backup) as source:
+            try:
+                header = read_header(source)
+                if header["guild_id"] != guild_id:
+                    raise BackupError("This backup was made in another server.")
+                if self.bot.votes is not None:
+                    await self.bot.votes.flush()
+                async with self.bot.db.acquire() as con:
+                    counts = await restore_guild(con, guild_id, source)
+            except BackupError as e:
+                await interaction.followup.send(str(e), ephemeral=True)
+                return
+
+        self.bot.settings_cache.invalidate(guild_id)
+        self.bot.topic_choices.invalidate(guild_id)
+        self.bot.topics.invalidate(guild_id)
+        if self.bot.votes is not None:
+            self.bot.votes.forget_all()
+        self.bot.leaderboards.reload(guild_id)
+        await recreate_views(self.bot, guild_id)
+
+        summary = ", ".join(f"{count} {table}" for table, count in counts.items())
+        self.log.info(f"Restored guild {guild_id}: {summary}")
+        await interaction.followup.send(f"Backup restored: {summary}.", ephemeral=True)
+
+    async def download(self, attachment: discord.Attachment) -> IO[bytes]:
+        """Streams an attachment into a temporary file, so a large upload isn't held in memory"""
+        source = TemporaryFile()
+        async with aiohttp.ClientSession() as session:
+            async with session.get(attachment.url) as response:
+                response.raise_for_status()
+                async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                    source.write(chunk)
+        source.seek(0)
+        return source
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Backup(bot))
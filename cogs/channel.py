@@ -1,8 +1,13 @@
+from __future__ import annotations
 import discord
 from discord import app_commands
 from discord.ext import commands
 from utils.common import *
-from main import ModMailInternal
+from utils import queries
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from main import ModMailInternal
 
 
 @app_commands.guild_only()
@@ -32,11 +37,10 @@ class Channel(
             )
 
         await set_guild(self.bot, interaction.guild.id)
-        await self.bot.db.execute(
-            "UPDATE settings SET output_channel_id = $1 WHERE guild_id = $2",
-            channel.id,
-            interaction.guild.id,
+        record = await self.bot.db.fetchrow(
+            queries.SETTINGS_SET_CHANNEL, interaction.guild.id, channel.id
         )
+        self.bot.settings_cache.store(record)
         await interaction.response.send_message(
             f"Output channel set to: {channel.mention}", ephemeral=True
         )
@@ -46,36 +50,48 @@ class Channel(
     async def channel_unset(self, interaction: discord.Interaction):
         """Unset's the active channel for a server"""
         await set_guild(self.bot, interaction.guild.id)
-        has_channel = await self.bot.db.fetchval(
-            "SELECT output_channel_id FROM settings WHERE guild_id = $1",
-            interaction.guild_id,
-        )
-        if not has_channel:
+        settings = await self.bot.settings_cache.get(interaction.guild_id)
+        if not settings.output_channel_id:
             return await interaction.response.send_message(
                 f"Output channel not set", ephemeral=True
             )
-        await self.bot.db.execute(
-            "UPDATE settings SET output_channel_id = NULL WHERE guild_id = $1",
-            interaction.guild.id,
+        record = await self.bot.db.fetchrow(
+            queries.SETTINGS_SET_CHANNEL, interaction.guild.id, None
         )
+        self.bot.settings_cache.store(record)
         await interaction.response.send_message(f"Output channel unset", ephemeral=True)
 
+    @app_commands.command(name="priority")
+    @app_commands.describe(thread="The thread to keep the topic leaderboard in")
+    @app_commands.default_permissions(administrator=True)
+    async def channel_priority(
+        self, interaction: discord.Interaction, thread: discord.Thread
+    ):
+        """Sets the thread that lists topics ordered by priority"""
+        await set_guild(self.bot, interaction.guild.id)
+        record = await self.bot.db.fetchrow(
+            queries.SETTINGS_SET_PRIORITY_THREAD, interaction.guild.id, thread.id
+        )
+        self.bot.settings_cache.store(record)
+        await interaction.response.send_message(
+            f"Topics will be ranked by priority in {thread.mention}", ephemeral=True
+        )
+        self.bot.leaderboards.schedule_render(interaction.guild_id)
+
     @app_commands.command(name="list")
     async def channel_list(self, interaction: discord.Interaction):
         """Lists current listed channel"""
-        channel_id = await self.bot.db.fetchval(
-            "SELECT output_channel_id FROM settings WHERE guild_id = $1",
-            interaction.guild_id,
-        )
-        if not channel_id:
+        settings = await self.bot.settings_cache.get(interaction.guild_id)
+        channel_id = settings.output_channel_id
+        # A deleted channel is unset by the reconcile cog, until then it's as good as unset
+        channel = interaction.guild.get_channel(channel_id) if channel_id else None
+        if not channel:
             return await interaction.response.send_message(
                 "No channel has been set", ephemeral=True
             )
-        else:
-            channel = interaction.guild.get_channel(channel_id)
-            return await interaction.response.send_message(
-                f"Channel has been set to: {channel.mention}", ephemeral=True
-            )
+        return await interaction.response.send_message(
+            f"Channel has been set to: {channel.mention}", ephemeral=True
+        )
 
 
 async def setup(bot: commands.Bot):
@@ -0,0 +1,190 @@
+from __future__ import annotations
+import asyncio
+import asyncpg
+import discord
+from discord.ext import commands
+from cogs.role import remove_role_ids, stale_role_ids
+from utils.common import configure_logging
+from utils import queries
+from typing import TYPE_CHECKING, List, Optional
+
+if TYPE_CHECKING:
+    from main import ModMailInternal
+
+
+class Reconcile(commands.Cog):
+    """Cleans up settings and topics that point at deleted channels, threads and roles.
+
+    Delete events are handled as they arrive. A background worker also walks every guild this process serves,
+    a few topics at a time, to catch whatever was deleted while the bot was offline.
+    Commands can then assume what they read still exists instead of cleaning up themselves.
+    """
+
+    def __init__(self, bot: ModMailInternal) -> None:
+        self.bot = bot
+        self.log = configure_logging("reconcile")
+        self.interval = bot.config.reconcile_interval
+        self.batch_size = bot.config.reconcile_batch_size
+        self._task: Optional[asyncio.Task[None]] = None
+
+    async def cog_load(self) -> None:
+        if self.interval is not None:
+            self._task = asyncio.create_task(self._worker())
+
+    async def cog_unload(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _worker(self) -> None:
+        await self.bot.wait_until_ready()
+        while True:
+            # Every cluster reconciles the guilds it has cached
+            for guild in list(self.bot.guilds):
+                # Unavailable guilds have no channels or roles cached, everything would look deleted
+                if guild.unavailable:
+                    continue
+                try:
+                    await self.reconcile_settings(guild)
+                    after = 0
+                    while True:
+                        topics = await self.bot.db.fetch(
+                            queries.TOPICS_THREADS_PAGE,
+                            guild.id,
+                            after,
+                            self.batch_size,
+                        )
+                        if not topics:
+                            break
+                        await self.reconcile_topics(guild, topics)
+                        after = topics[-1]["id"]
+                        # Paced per batch checked, guilds without topics cost no wait
+                        await asyncio.sleep(self.interval)
+                except Exception:
+                    self.log.exception(f"Unable to reconcile guild {guild.id}")
+                    await asyncio.sleep(self.interval)
+            # Also keeps a cluster without guilds from spinning
+            await asyncio.sleep(self.interval)
+
+    async def channel_exists(self, guild: discord.Guild, channel_id: int) -> bool:
+        """Whether a channel or thread still exists, only trusting Discord's NotFound when it isn't cached"""
+        if guild.get_channel_or_thread(channel_id) is not None:
+            return True
+        try:
+            await guild.fetch_channel(channel_id)
+        except discord.NotFound:
+            return False
+        except discord.HTTPException:
+            # Missing access or a hiccup, try again on the next pass
+            return True
+        return True
+
+    async def deleted_role_ids(
+        self, guild: discord.Guild, role_ids: List[int]
+    ) -> List[int]:
+        """Whitelisted roles missing from the cache that Discord confirms are gone"""
+        uncached = stale_role_ids(guild, role_ids)
+        if not uncached:
+            return []
+        try:
+            existing = {role.id for role in await guild.fetch_roles()}
+        except discord.HTTPException:
+            return []
+        return [rid for rid in uncached if rid not in existing]
+
+    async def reconcile_settings(self, guild: discord.Guild) -> None:
+        settings = await self.bot.settings_cache.get(guild.id)
+        if settings.output_channel_id and not await self.channel_exists(
+            guild, settings.output_channel_id
+        ):
+            await self.unset_channel(guild.id)
+        if settings.priority_counting_thread and not await self.channel_exists(
+            guild, settings.priority_counting_thread
+        ):
+            await self.unset_priority_thread(guild.id)
+        deleted = await self.deleted_role_ids(guild, settings.allowed_role_ids)
+        if deleted:
+            await remove_role_ids(self.bot, guild.id, deleted)
+            self.log.info(
+                f"Removed deleted roles {deleted} from the whitelist of guild {guild.id}"
+            )
+
+    async def reconcile_topics(
+        self, guild: discord.Guild, topics: List[asyncpg.Record]
+    ) -> None:
+        for topic in topics:
+            if not await self.channel_exists(guild, topic["thread_id"]):
+                await self.archive_topic(guild.id, topic["id"], topic["thread_id"])
+
+    async def unset_channel(self, guild_id: int) -> None:
+        record = await self.bot.db.fetchrow(
+            queries.SETTINGS_SET_CHANNEL, guild_id, None
+        )
+        if record:
+            self.bot.settings_cache.store(record)
+        self.log.info(f"Unset the deleted topic channel of guild {guild_id}")
+
+    async def unset_priority_thread(self, guild_id: int) -> None:
+        record = await self.bot.db.fetchrow(
+            queries.SETTINGS_SET_PRIORITY_THREAD, guild_id, None
+        )
+        if record:
+            self.bot.settings_cache.store(record)
+        self.bot.leaderboards.forget(guild_id)
+        self.log.info(f"Unset the deleted priority counting thread of guild {guild_id}")
+
+    async def archive_topic(self, guild_id: int, topic_id: int, thread_id: int) -> None:
+        """Moves a topic whose thread was deleted into the archive"""
+        if self.bot.votes is not None:
+            await self.bot.votes.flush()
+        archived = await self.bot.db.fetchrow(
+            queries.TOPIC_ARCHIVE,
+            topic_id,
+            guild_id,
+            "deleted",
+            self.bot.user.id,
+            "The topic's thread was deleted.",
+        )
+        if archived is None:
+            # Closed in the meantime
+            return
+        if self.bot.votes is not None:
+            self.bot.votes.forget(topic_id)
+        self.bot.topics.invalidate(guild_id, thread_id)
+        self.bot.topic_choices.invalidate(guild_id)
+        await self.bot.leaderboards.topic_removed(guild_id, topic_id)
+        self.log.info(
+            f"Archived topic {topic_id} of guild {guild_id}, its thread was deleted"
+        )
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        settings = await self.bot.settings_cache.get(channel.guild.id)
+        if channel.id == settings.output_channel_id:
+            await self.unset_channel(channel.guild.id)
+
+    # The raw event also fires for threads that weren't cached, which most topic threads are once archived
+    @commands.Cog.listener()
+    async def on_raw_thread_delete(self, payload: discord.RawThreadDeleteEvent):
+        settings = await self.bot.settings_cache.get(payload.guild_id)
+        if payload.thread_id == settings.priority_counting_thread:
+            await self.unset_priority_thread(payload.guild_id)
+        topic = await self.bot.db.fetchrow(
+            queries.TOPIC_BY_THREAD, payload.guild_id, payload.thread_id
+        )
+        if topic is not None:
+            await self.archive_topic(payload.guild_id, topic["id"], payload.thread_id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        """Drops deleted roles from the whitelist"""
+        settings = await self.bot.settings_cache.get(role.guild.id)
+        if role.id in settings.allowed_roles:
+            await remove_role_ids(self.bot, role.guild.id, [role.id])
+            self.log.info(
+                f"Removed deleted role {role.id} from the whitelist of {role.guild.name} ({role.guild.id})"
+            )
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Reconcile(bot))
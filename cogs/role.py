@@ -3,7 +3,12 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 from utils.common import *
-from main import ModMailInternal
+from utils import queries
+from typing import TYPE_CHECKING, Iterable, List, Optional
+import asyncpg
+
+if TYPE_CHECKING:
+    from main import ModMailInternal
 
 
 @app_commands.guild_only()
@@ -25,16 +30,18 @@ class Role(
     async def role_add(self, interaction: discord.Interaction, role: discord.Role):
         """Sets a role to be allowed to make a new topic"""
         await set_guild(self.bot, interaction.guild_id)
-        role_id_data = await self.bot.db.fetchval(
-            "SELECT allowed_role_ids FROM settings WHERE guild_id = $1",
-            interaction.guild_id,
-        )
+        role_id_data = (
+            await self.bot.settings_cache.get(interaction.guild_id)
+        ).allowed_role_ids
         if not role_id_data or role.id not in role_id_data:
-            await self.bot.db.execute(
-                "UPDATE settings SET allowed_role_ids = array_append(allowed_role_ids, $1) WHERE guild_id = $2",
-                role.id,
+            # Roles deleted from the server are pruned on the way
+            record = await self.bot.db.fetchrow(
+                queries.SETTINGS_ADD_ROLE,
                 interaction.guild_id,
+                role.id,
+                stale_role_ids(interaction.guild, role_id_data),
             )
+            self.bot.settings_cache.store(record)
             await interaction.response.send_message(
                 f"Users with role `{role.name}` can now make topics.", ephemeral=True
             )
@@ -49,21 +56,22 @@ class Role(
     async def role_remove(self, interaction: discord.Interaction, role: discord.Role):
         """Removes a role for the topic whitelist."""
         await set_guild(self.bot, interaction.guild_id)
-        role_id_data = await self.bot.db.fetchval(
-            "SELECT allowed_role_ids FROM settings WHERE guild_id = $1",
-            interaction.guild_id,
-        )
+        role_id_data = (
+            await self.bot.settings_cache.get(interaction.guild_id)
+        ).allowed_role_ids
         if not role_id_data or not role.id in role_id_data:
             await interaction.response.send_message(
                 "Role not on whitelist.", ephemeral=True
             )
 
         else:
-            await self.bot.db.execute(
-                "UPDATE settings SET allowed_role_ids = array_remove(allowed_role_ids, $1) WHERE guild_id = $2",
-                role.id,
+            # Roles deleted from the server are pruned on the way
+            record = await remove_role_ids(
+                self.bot,
                 interaction.guild_id,
+                [role.id, *stale_role_ids(interaction.guild, role_id_data)],
             )
+            self.bot.settings_cache.store(record)
             await interaction.response.send_message(
                 f"`{role.name}` removed from whitelist.", ephemeral=True
             )
@@ -72,24 +80,33 @@ class Role(
     async def role_list(self, interaction: discord.Interaction):
         """Lists all whitelisted roles that can make topics"""
         await set_guild(self.bot, interaction.guild_id)
-        role_id_data = await self.bot.db.fetchval(
-            "SELECT allowed_role_ids FROM settings WHERE guild_id = $1",
-            interaction.guild_id,
-        )
-        output_str = ""
-        if not role_id_data:
+        role_id_data = (
+            await self.bot.settings_cache.get(interaction.guild_id)
+        ).allowed_role_ids
+        # Deleted roles are pruned by the reconcile cog, skip any it hasn't caught up with
+        roles = [r for r in map(interaction.guild.get_role, role_id_data) if r]
+        if not roles:
             return await interaction.response.send_message(
                 "No roles saved.", ephemeral=True
             )
-        for rid in role_id_data:
-            role = interaction.guild.get_role(rid)
-            if role:
-                output_str += f"- `{role.name}` ({role.id})\n"
-            else:
-                output_str += f":warning: Role ID ({rid}) no longer exists in server, please remove.\n"
-
+        output_str = "".join(f"- `{role.name}` ({role.id})\n" for role in roles)
         await interaction.response.send_message(output_str, ephemeral=True)
 
 
+def stale_role_ids(guild: discord.Guild, role_ids: Iterable[int]) -> List[int]:
+    """Whitelisted role ids that no longer exist in the server"""
+    return [rid for rid in role_ids if guild.get_role(rid) is None]
+
+
+async def remove_role_ids(
+    bot: ModMailInternal, guild_id: int, role_ids: List[int]
+) -> Optional[asyncpg.Record]:
+    """Removes role ids from a guild's whitelist and refreshes the cached settings"""
+    record = await bot.db.fetchrow(queries.SETTINGS_REMOVE_ROLES, guild_id, role_ids)
+    if record:
+        bot.settings_cache.store(record)
+    return record
+
+
 async def setup(bot: commands.Bot):
     await bot.add_cog(Role(bot))
@@ -3,14 +3,19 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 from utils.common import configure_logging
-from utils.ui import TopicView, edit_topic, ClosingModal
+from utils.ui import make_topic_view, edit_topic, ClosingModal, KeysetPaginator
 import utils.checks as checks
-from typing import TYPE_CHECKING
+from utils import queries
+from utils.outbound import Lane
+from typing import TYPE_CHECKING, List, Optional, Tuple
 import asyncpg
 
 if TYPE_CHECKING:
     from main import ModMailInternal
 
+SEARCH_PAGE_SIZE = 10
+HISTORY_PAGE_SIZE = 10
+
 
 @app_commands.guild_only()
 class Topic(commands.GroupCog):
@@ -33,106 +38,81 @@ class Topic(commands.GroupCog):
         description_message: str,
     ):
         """Creates a new topic"""
-        channel = interaction.guild.get_channel(
-            await self.bot.db.fetchval(
-                "SELECT output_channel_id FROM settings WHERE guild_id = $1",
-                interaction.guild_id,
-            )
-        )
+        settings = await self.bot.settings_cache.get(interaction.guild_id)
+        channel = interaction.guild.get_channel(settings.output_channel_id)
         topic_id = interaction.id
         thread, first_post = await channel.create_thread(
             name=topic_title,
             content=description_message,
-            view=TopicView(self.bot, interaction.user.id, topic_id),
+            view=make_topic_view(self.bot, interaction.user.id, topic_id),
+        )
+        self.bot.outbound.submit(thread.id, first_post.pin, lane=Lane.COSMETIC)
+        # Update database, the author's vote is recorded alongside the topic
+        await self.bot.db.execute(
+            queries.TOPIC_CREATE,
+            topic_id,
+            interaction.guild_id,
+            topic_title,
+            description_message,
+            1,
+            first_post.id,
+            interaction.user.id,
+            thread.id,
         )
-        await first_post.pin()
-        # TODO: Update priorities
-        # Update database
-        con: asyncpg.Connection
-        async with self.bot.db.acquire() as con:
-            await con.execute(
-                """INSERT INTO topics (
-                              id, 
-                              guild_id, 
-                              title,
-                              message, 
-                              priority_level, 
-                              message_id, 
-                              author_id, 
-                              thread_id) VALUES ($1, $2, $3, $4, $5, $6, $7, $8)""",
-                topic_id,
-                interaction.guild_id,
-                topic_title,
-                description_message,
-                1,
-                first_post.id,
-                interaction.user.id,
-                thread.id,
-            )
-            await con.execute(
-                "UPDATE topics SET users_in_favor = array_append(users_in_favor, $1) WHERE id = $2",
-                interaction.user.id,
-                topic_id,
-            )
         await interaction.response.send_message(
             f"Topic added in thread {thread.mention}, You have been automatically placed in favor of this topic.",
             ephemeral=True,
         )
+        self.bot.topic_choices.invalidate(interaction.guild_id)
+        await self.bot.leaderboards.topic_added(
+            interaction.guild_id, topic_id, thread.id, 1
+        )
 
     @checks.topic_whitelist()
     @app_commands.command(name="edit")
     @app_commands.describe(thread="The thread of the topic you want to edit.")
-    async def edit_topic(
-        self, interaction: discord.Interaction, thread: discord.Thread = None
-    ):
+    async def edit_topic(self, interaction: discord.Interaction, thread: str = None):
         """Edits a topic message"""
-        thread = await checks.validate_thread(self.bot, interaction, thread)
-        if not thread:
+        resolved = await checks.validate_thread(self.bot, interaction, thread)
+        if not resolved:
             return
 
-        thread_ids = await self.bot.db.fetch(
-            "SELECT thread_id FROM topics WHERE guild_id = $1 AND author_id = $2",
-            interaction.guild_id,
-            interaction.user.id,
-        )
-        thread_ids = [t["thread_id"] for t in thread_ids]
-        if not thread.id in thread_ids:
+        thread, topic = resolved
+        if topic.author_id != interaction.user.id:
             return await interaction.response.send_message(
                 "You cannot edit this topic as you did not create it.", ephemeral=True
             )
-        topic_id = await self.bot.db.fetchval(
-            "SELECT id FROM topics WHERE thread_id = $1", thread.id
-        )
 
-        await edit_topic(self.bot, interaction, topic_id)
+        await edit_topic(self.bot, interaction, topic.id, thread=thread)
+
+    @edit_topic.autocomplete("thread")
+    async def edit_topic_autocomplete(
+        self, interaction: discord.Interaction, current: str
+    ) -> List[app_commands.Choice[str]]:
+        # Only authors can edit, admins included
+        return await self.topic_choices(interaction, current, interaction.user.id)
 
     @checks.topic_whitelist()
     @app_commands.command(name="close")
     @app_commands.describe(thread="The thread you wish to close.")
-    async def close_topic(
-        self, interaction: discord.Interaction, thread: discord.Thread = None
-    ):
+    async def close_topic(self, interaction: discord.Interaction, thread: str = None):
         """Closes a topic. Either a user's own topic or concludes a topic by an admin"""
-        thread = await checks.validate_thread(self.bot, interaction, thread)
-        if not thread:
+        resolved = await checks.validate_thread(self.bot, interaction, thread)
+        if not resolved:
             return
 
-        topic_id, author_id = await self.bot.db.fetchrow(
-            "SELECT id, author_id FROM topics WHERE guild_id = $1 AND thread_id = $2",
-            interaction.guild_id,
-            thread.id,
-        )
+        thread, topic = resolved
         closer = None
         author = interaction.user
-        if author.id == author_id:
+        if author.id == topic.author_id:
             closer = "op"
-        elif author.guild_permissions.administrator == True:
+        elif interaction.permissions.administrator:
             closer = "admin"
 
         if closer is not None:
             try:
                 await interaction.response.send_modal(
-                    ClosingModal(self.bot.db, thread, topic_id, closer)
+                    ClosingModal(self.bot.db, thread, topic.id, closer)
                 )
             except Exception as e:
                 self.log.exception("Error")
@@ -142,6 +122,98 @@ class Topic(commands.GroupCog):
                 ephemeral=True,
             )
 
+    @close_topic.autocomplete("thread")
+    async def close_topic_autocomplete(
+        self, interaction: discord.Interaction, current: str
+    ) -> List[app_commands.Choice[str]]:
+        # Admins can close any topic
+        author_id = (
+            None if interaction.permissions.administrator else interaction.user.id
+        )
+        return await self.topic_choices(interaction, current, author_id)
+
+    async def topic_choices(
+        self, interaction: discord.Interaction, current: str, author_id: Optional[int]
+    ) -> List[app_commands.Choice[str]]:
+        """Open topics whose title starts with what has been typed so far"""
+        matches = await self.bot.topic_choices.matching(
+            interaction.guild_id, author_id, current
+        )
+        return [
+            app_commands.Choice(name=choice.title[:100], value=str(choice.thread_id))
+            for choice in matches
+        ]
+
+    @checks.topic_whitelist()
+    @app_commands.command(name="search")
+    @app_commands.describe(query="Words to look for in topic titles and messages")
+    async def search_topics(self, interaction: discord.Interaction, query: str):
+        """Searches this server's open topics"""
+        guild_id = interaction.guild_id
+
+        async def fetch(after: Optional[Tuple], limit: int) -> List[asyncpg.Record]:
+            rank, topic_id = after or (None, None)
+            return await self.bot.db.fetch(
+                queries.TOPICS_SEARCH, guild_id, query, rank, topic_id, limit
+            )
+
+        def render(rows: List[asyncpg.Record], page: int) -> discord.Embed:
+            start = page * SEARCH_PAGE_SIZE + 1
+            lines = [
+                f"{n}. <#{row['thread_id']}> {row['title']} (priority {row['priority_level']})"
+                for n, row in enumerate(rows, start=start)
+            ]
+            embed = discord.Embed(
+                title=f"Topics matching {query}"[:256], description="\n".join(lines)
+            )
+            return embed.set_footer(text=f"Page {page + 1}")
+
+        paginator = KeysetPaginator(
+            interaction.user.id,
+            fetch,
+            lambda row: (row["rank"], row["id"]),
+            render,
+            SEARCH_PAGE_SIZE,
+        )
+        await paginator.start(interaction, "No topics matched your search.")
+
+    @checks.topic_whitelist()
+    @app_commands.command(name="history")
+    async def topic_history(self, interaction: discord.Interaction):
+        """Lists this server's closed topics, newest first"""
+        guild_id = interaction.guild_id
+
+        async def fetch(after: Optional[Tuple], limit: int) -> List[asyncpg.Record]:
+            closed_at, topic_id = after or (None, None)
+            return await self.bot.db.fetch(
+                queries.ARCHIVE_HISTORY, guild_id, closed_at, topic_id, limit
+            )
+
+        def render(rows: List[asyncpg.Record], page: int) -> discord.Embed:
+            lines = []
+            for row in rows:
+                line = (
+                    f"<#{row['thread_id']}> {row['title']} "
+                    f"(closed <t:{int(row['closed_at'].timestamp())}:d> by {row['closed_by']}, "
+                    f"priority {row['priority_level']})"
+                )
+                if row["remarks"]:
+                    line += f"\n> {row['remarks'][:150]}"
+                lines.append(line)
+            embed = discord.Embed(
+                title="Closed topics", description="\n".join(lines)[:4096]
+            )
+            return embed.set_footer(text=f"Page {page + 1}")
+
+        paginator = KeysetPaginator(
+            interaction.user.id,
+            fetch,
+            lambda row: (row["closed_at"], row["id"]),
+            render,
+            HISTORY_PAGE_SIZE,
+        )
+        await paginator.start(interaction, "No closed topics yet.")
+
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(Topic(bot))
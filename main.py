@@ -7,32 +7,62 @@ from discord.app_commands.errors import *
 from discord.ext import commands
 import yaml
 import asyncio
+import io
+import signal
+import time
 from utils.common import configure_logging
-from typing import Literal, Optional
-from utils.ui import recreate_views
+from utils.cluster import ClusterInfo
+from utils.config import RELOADABLE, Config, ConfigError, changed_keys, load_config
+from utils.logs import start_logging, stop_logging
+from utils.cache import SettingsCache, TopicChoices
+from utils.topics import TopicRepository
+from utils.leaderboard import LeaderboardManager
+from utils.votes import VoteBuffer
+from utils.archive import ArchivePartitions
+from utils.outbound import OutboundScheduler
+from utils.metrics import Metrics
+from utils.memory import format_report, memory_report
+from utils.db import Database, create_pool
+from utils.migrations import (
+    discover_migrations,
+    migrations_checksum,
+    run_migrations,
+    schema_is_current,
+)
+from utils.startup import StartupTimer
+from utils.sync import CommandSync, SyncPlan
+from typing import Any, Dict, List, Literal, Optional, Tuple
+from utils.ui import recreate_views, register_views
 import utils.errors as errors
 
 
-def read_config(config: str) -> str:
+def read_startup_config() -> Config:
     try:
-        with open("data/config.yml", "r") as f:
-            loadedYml = yaml.safe_load(f)
-            return loadedYml[config]
+        return load_config()
     except FileNotFoundError:
         print("Cannot find config.yml. Does it exist?")
         sys.exit(1)
-
-
-async def create_pool():
-    return await asyncpg.create_pool(read_config("db"))
+    except (ConfigError, yaml.YAMLError) as e:
+        print(f"config.yml is invalid: {e}")
+        sys.exit(1)
 
 
 class MMITree(discord.app_commands.CommandTree):
     """Custom cls for app command tree. Used primarily for error handling"""
 
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        self.client.metrics.command_started(interaction)
+        startup = self.client.startup
+        if startup.first_interaction():
+            self.client.log.info(
+                f"First interaction {startup.first_interaction_after:.2f}s after startup"
+            )
+        return True
+
     async def on_error(
         self, interaction: discord.Interaction, error: AppCommandError
     ) -> None:
+        self.client.metrics.command_finished(interaction, failed=True)
         if isinstance(error, MissingPermissions):
             await interaction.response.send_message(
                 "You don't have permission to use this command", ephemeral=True
@@ -40,7 +70,7 @@ class MMITree(discord.app_commands.CommandTree):
 
         elif isinstance(error, CommandSignatureMismatch):
             await interaction.response.send_message(
-                f"Command has a mismatched signature, run `{read_config('prefix')}sync`."
+                f"Command has a mismatched signature, run `{self.client.config.prefix}sync`."
             )
         elif isinstance(error, errors.MMIError):
             await interaction.response.send_message(error.message, ephemeral=True)
@@ -75,30 +105,64 @@ class MMITree(discord.app_commands.CommandTree):
             self.client.log.error(log_msg + "".join(tb) + "\n\n")
 
 
-class ModMailInternal(commands.Bot):
+class ModMailInternal(commands.AutoShardedBot):
     """A bot for bringing up discussions anonymously by team members for other team members"""
 
-    def __init__(self):
-        self.db: asyncpg.Pool
+    def __init__(self, cluster: ClusterInfo = ClusterInfo()):
+        self.startup = StartupTimer()
+        self.db: Database
+        self.cluster = cluster
+        self.config = config = read_startup_config()
+        start_logging(
+            # Processes of a cluster can't share one rotating file
+            f"mmi-cluster{cluster.cluster_id}" if cluster.clustered else "mmi",
+            config.log_max_bytes,
+            config.log_backup_count,
+            config.log_json,
+            config.log_queue_size,
+        )
         self.log = configure_logging("bot")
+        self.startup.record("config", self.startup.elapsed())
+        self.metrics = Metrics(self)
+        self.settings_cache = SettingsCache(self, config.settings_cache_ttl)
+        self.topic_choices = TopicChoices(self, config.autocomplete_cache_ttl)
+        self.topics = TopicRepository(self)
+        self.view_mode: Literal["dynamic", "legacy"] = config.view_mode
+        self.view_restore_batch_size = config.view_restore_batch_size
+        self.leaderboards = LeaderboardManager(
+            self, config.leaderboard_delay, config.leaderboard_size
+        )
+        self.outbound = OutboundScheduler(self.log)
+        self.votes: Optional[VoteBuffer] = None
+        if config.vote_write_behind:
+            self.votes = VoteBuffer(self, config.vote_flush_interval)
+        self.archive = ArchivePartitions(self)
+        self.command_sync = CommandSync(self)
+        self._reload_task: Optional[asyncio.Task[None]] = None
+        self._views_task: Optional[asyncio.Task[None]] = None
+        self._sync_task: Optional[asyncio.Task[None]] = None
         super().__init__(
-            command_prefix=read_config("prefix"),
+            command_prefix=config.prefix,
             description="The bot to handle suggestions from all members of a team!",
             allow_mentions=discord.AllowedMentions(
                 everyone=False, users=False, roles=False
             ),
-            intents=discord.Intents().all(),
+            **self.gateway_options(),
             help_command=commands.MinimalHelpCommand(),
-            activity=discord.Activity(
-                name=read_config("activity"), type=discord.ActivityType.listening
-            ),
+            activity=self.make_activity(),
             tree_cls=MMITree,
+            shard_ids=list(cluster.shard_ids) if cluster.shard_ids else None,
+            shard_count=cluster.shard_count or config.shard_count,
         )
 
     async def setup_hook(self) -> None:
         """Async initialization"""
         try:
-            self.db = await create_pool()
+            with self.startup.phase("pool"):
+                self.db = Database(
+                    await create_pool(self.config.db, self.config.pool),
+                    self.metrics,
+                )
             self.log.info("Database pool has started!")
         except Exception as e:
             self.log.exception(
@@ -107,37 +171,160 @@ class ModMailInternal(commands.Bot):
             exit(-1)
             # self.log.exception(f"Traceback: {format_exception(type(e), e, e.__traceback__)}")
 
-        await self.prepare_db()
+        with self.startup.phase("schema"):
+            await self.prepare_db()
         self.log.info("Schema configured")
-        modules = ["channel", "topic", "role"]
-        for module in modules:
-            try:
-                await self.load_extension("cogs." + module)
-                self.log.info(f"{module} loaded")
-            except commands.errors.ExtensionError:
-                self.log.exception(f"Unable to load {module}, quitting")
+        if self.votes is not None:
+            self.votes.start()
+        if self.cluster.is_primary:
+            self.archive.start()
+        modules = ["channel", "topic", "role", "backup", "reconcile"]
+        with self.startup.phase("extensions"):
+            results = await asyncio.gather(
+                *(self.load_extension("cogs." + module) for module in modules),
+                return_exceptions=True,
+            )
+        for module, result in zip(modules, results):
+            if isinstance(result, BaseException):
+                self.log.error(f"Unable to load {module}, quitting", exc_info=result)
                 exit(-1)
+            self.log.info(f"{module} loaded")
+
+        register_views(self)
+        # Buttons are answered through the catch-all view meanwhile, so connecting doesn't wait for this
+        self._views_task = asyncio.create_task(self.restore_views())
+        if self.cluster.is_primary:
+            # Every cluster has the same tree, one of them syncing is enough
+            self._sync_task = asyncio.create_task(self.command_sync.sync_on_startup())
+
+        metrics_port = self.config.metrics_port
+        if metrics_port:
+            # Every cluster serves its own metrics
+            metrics_port += self.cluster.cluster_id
+            await self.metrics.start_server(self.config.metrics_host, metrics_port)
+            self.log.info(f"Serving metrics on port {metrics_port}")
+
+        try:
+            self.loop.add_signal_handler(signal.SIGHUP, self.on_sighup)
+            # Shut down cleanly when the cluster launcher or docker stops the process
+            self.loop.add_signal_handler(
+                signal.SIGTERM, lambda: asyncio.create_task(self.close())
+            )
+        except (AttributeError, NotImplementedError):
+            # No SIGHUP or signal handlers on Windows, the owner command still works
+            pass
 
-        await recreate_views(self)
+    def gateway_options(self) -> Dict[str, Any]:
+        """Intents and caching for the configured gateway mode"""
+        if self.config.gateway_mode == "full":
+            return {"intents": discord.Intents().all()}
+        # Slash commands and buttons carry the member and their permissions in the payload.
+        # Guilds keeps channels, threads and roles cached, DM messages are for the owner text commands.
+        intents = discord.Intents.none()
+        intents.guilds = True
+        intents.dm_messages = True
+        return {
+            "intents": intents,
+            "member_cache_flags": discord.MemberCacheFlags.none(),
+            "chunk_guilds_at_startup": False,
+        }
+
+    def make_activity(self) -> discord.Activity:
+        return discord.Activity(
+            name=self.config.activity, type=discord.ActivityType.listening
+        )
+
+    async def reload_config(self) -> Tuple[List[str], List[str]]:
+        """Re-reads the config file and applies what can change at runtime.
+
+        Returns the keys that were applied and the changed keys that only take effect after a restart.
+        """
+        new = load_config()
+        changed = changed_keys(self.config, new)
+        applied = [key for key in changed if key in RELOADABLE]
+        pending = [key for key in changed if key not in RELOADABLE]
+        # Keep the running values for anything a reload can't apply
+        self.config = new._replace(
+            **{key: getattr(self.config, key) for key in pending}
+        )
+
+        self.command_prefix = self.config.prefix
+        self.leaderboards.delay = self.config.leaderboard_delay
+        self.leaderboards.size = self.config.leaderboard_size
+        self.settings_cache.ttl = self.config.settings_cache_ttl
+        self.topic_choices.cache.ttl = self.config.autocomplete_cache_ttl
+        if self.votes is not None:
+            self.votes.interval = self.config.vote_flush_interval
+        if "activity" in applied and self.is_ready():
+            await self.change_presence(activity=self.make_activity())
+
+        self.log.info(f"Config reloaded, applied: {', '.join(applied) or 'nothing'}")
+        if pending:
+            self.log.warning(
+                f"Restart to apply config changes to: {', '.join(pending)}"
+            )
+        return applied, pending
+
+    def on_sighup(self) -> None:
+        if self._reload_task is not None and not self._reload_task.done():
+            return
+        self._reload_task = asyncio.create_task(self._reload_from_signal())
+
+    async def _reload_from_signal(self) -> None:
+        try:
+            await self.reload_config()
+        except Exception:
+            self.log.exception("Unable to reload the config, keeping the current one")
+
+    async def restore_views(self) -> None:
+        start = time.perf_counter()
+        try:
+            await recreate_views(self)
+        except Exception:
+            self.log.exception("Unable to restore topic views")
+        self.startup.record("views", time.perf_counter() - start)
 
     async def prepare_db(self):
-        """Prepares schema for usage"""
+        """Brings the schema up to date by running any pending migrations"""
         async with self.db.acquire() as conn:
             try:
-                with open("schema.sql", "r") as schema:
-                    try:
-                        await conn.execute(schema.read())
-                    except asyncpg.PostgresError:
-                        self.log.exception(
-                            "A SQL error has occurred while running the schema"
-                        )
-                        sys.exit(-1)
-
+                checksum = migrations_checksum(discover_migrations())
+                if await schema_is_current(conn, checksum):
+                    self.log.info("Schema checksum matches, skipping migrations")
+                    return
+                applied = await run_migrations(conn, self.log)
             except FileNotFoundError:
+                self.log.error("Migrations folder not found, please check your files.")
+                sys.exit(-1)
+            except ValueError as e:
+                # Raised by discover_migrations for duplicate version numbers
                 self.log.error(
-                    "Schema file not found, please check your files, remember to rename schema.sql.example to schema.sql when you would like to use it."
+                    f"Invalid migrations folder, please check your files: {e}"
                 )
                 sys.exit(-1)
+            except asyncpg.PostgresError:
+                self.log.exception(
+                    "A SQL error has occurred while migrating the schema"
+                )
+                sys.exit(-1)
+
+        if not applied:
+            self.log.info("Schema already up to date")
+
+    async def close(self) -> None:
+        """Flushes buffered state before shutting down"""
+        await self.metrics.stop_server()
+        for task in (self._views_task, self._sync_task):
+            if task is not None:
+                task.cancel()
+        self.archive.stop()
+        if self.votes is not None:
+            try:
+                await self.votes.stop()
+            except Exception:
+                self.log.exception("Unable to flush buffered votes on shutdown")
+        await super().close()
+        stop_logging()
 
     async def on_command_error(self, ctx: commands.Context, error):
         """Handles errors"""
@@ -154,9 +341,9 @@ class ModMailInternal(commands.Bot):
             )
 
         elif isinstance(error, commands.errors.NotOwner):
-            await ctx.send(
-                f"Only {self.get_user(self.owner_id).name} can run this command."
-            )
+            # The owner isn't necessarily cached in lean gateway mode
+            owner = self.get_user(self.owner_id) or await self.fetch_user(self.owner_id)
+            await ctx.send(f"Only {owner.name} can run this command.")
         # handles all bad command usage
         elif isinstance(
             error,
@@ -203,57 +390,130 @@ class ModMailInternal(commands.Bot):
             print("".join(tb))
             self.log.error(log_msg + "".join(tb) + "\n\n")
 
+    async def on_app_command_completion(
+        self, interaction: discord.Interaction, command: discord.app_commands.Command
+    ):
+        """Records app command latency"""
+        self.metrics.command_finished(interaction)
+
     async def on_ready(self):
         """Runs on connection to discord's API"""
-        self.log.info(f"Bot has started! Logged in as {self.user.name}")
+        self.log.info(
+            f"Bot has started! Logged in as {self.user.name} "
+            f"(cluster {self.cluster.cluster_id}, shards {self.shard_ids or 'all'} of {self.shard_count})"
+        )
+        self.log.info(format_report(memory_report(self), self.config.gateway_mode))
+        if self.startup.ready():
+            self.log.info(self.startup.report())
+            if self.startup.ready_after > self.config.startup_target:
+                self.log.warning(
+                    f"Took {self.startup.ready_after:.2f}s to become ready, "
+                    f"over the startup_target of {self.config.startup_target:.0f}s"
+                )
+
 
+bot = ModMailInternal(ClusterInfo.from_env())
 
-bot = ModMailInternal()
+
+def describe_plan(plan: SyncPlan, where: str) -> str:
+    if not plan.needed:
+        return f"The {where} commands are in sync, nothing to do."
+    changes = (
+        "\n".join(plan.changes) or "No command changes, but no sync was recorded yet"
+    )
+    return f"Syncing the {where} commands would change:\n```diff\n{changes}```"
 
 
 # Credit to AbstractUmbra https://about.abstractumbra.dev/discord.py/2023/01/29/sync-command-example.html
 @bot.command()
-@commands.guild_only()
 @commands.is_owner()
 async def sync(
     ctx: commands.Context,
     guilds: commands.Greedy[discord.Object],
-    spec: Optional[Literal["~", "*", "^"]] = None,
+    spec: Optional[Literal["~", "*", "^", "?", "~?"]] = None,
 ) -> None:
-    """Free floating text command to allow the owner to sync bot. To be used almost never."""
-    if not guilds:
-        if spec == "~":
-            synced = await ctx.bot.tree.sync(guild=ctx.guild)
-        elif spec == "*":
-            ctx.bot.tree.copy_global_to(guild=ctx.guild)
-            synced = await ctx.bot.tree.sync(guild=ctx.guild)
-        elif spec == "^":
-            ctx.bot.tree.clear_commands(guild=ctx.guild)
-            await ctx.bot.tree.sync(guild=ctx.guild)
-            synced = []
-        else:
-            synced = await ctx.bot.tree.sync()
+    """Free floating text command to allow the owner to sync bot. To be used almost never.
+
+    Changed global commands are synced on startup. `?` shows what a global sync would change without syncing,
+    `~?` does the same for a guild. `~`, `*`, `^` and `~?` act on the guild ids given, or the current guild,
+    so they also work from DMs when the lean gateway mode doesn't receive guild messages.
+    """
+    command_sync: CommandSync = ctx.bot.command_sync
+    if not guilds and spec in (None, "?"):
+        if spec == "?":
+            await ctx.send(describe_plan(await command_sync.plan(), "global"))
+            return
+        synced = await command_sync.sync(force=True)
+        await ctx.send(f"Synced {len(synced)} commands globally")
+        return
 
-        await ctx.send(
-            f"Synced {len(synced)} commands {'globally' if spec is None else 'to the current guild.'}"
-        )
+    targets = guilds or ([ctx.guild] if ctx.guild is not None else [])
+    if not targets:
+        await ctx.send(f"Give the ids of the guilds to use `{spec}` on from DMs.")
+        return
+
+    if spec in ("?", "~?"):
+        for guild in targets:
+            plan = await command_sync.plan(guild)
+            await ctx.send(describe_plan(plan, f"guild {guild.id}'s"))
         return
 
     ret = 0
-    for guild in guilds:
+    for guild in targets:
         try:
-            await ctx.bot.tree.sync(guild=guild)
+            if spec == "*":
+                ctx.bot.tree.copy_global_to(guild=guild)
+            elif spec == "^":
+                ctx.bot.tree.clear_commands(guild=guild)
+            await command_sync.sync(guild, force=True)
         except discord.HTTPException:
             pass
         else:
             ret += 1
 
-    await ctx.send(f"Synced the tree to {ret}/{len(guilds)}.")
+    await ctx.send(f"Synced the tree to {ret}/{len(targets)}.")
+
+
+@bot.command()
+@commands.is_owner()
+async def metrics(ctx: commands.Context) -> None:
+    """Shows the bot's metrics in the Prometheus text format."""
+    text = ctx.bot.metrics.render()
+    if len(text) > 1900:
+        await ctx.send(
+            file=discord.File(io.BytesIO(text.encode()), filename="metrics.txt")
+        )
+    else:
+        await ctx.send(f"```\n{text}```")
+
+
+@bot.command()
+@commands.is_owner()
+async def memory(ctx: commands.Context) -> None:
+    """Shows resident memory per guild and the size of the member cache."""
+    report = memory_report(ctx.bot)
+    ctx.bot.log.info(format_report(report, ctx.bot.config.gateway_mode))
+    await ctx.send(format_report(report, ctx.bot.config.gateway_mode))
+
+
+@bot.command(name="reloadconfig")
+@commands.is_owner()
+async def reload_config(ctx: commands.Context) -> None:
+    """Re-reads data/config.yml and applies the settings that can change at runtime."""
+    try:
+        applied, pending = await ctx.bot.reload_config()
+    except Exception as e:
+        await ctx.send(f"Unable to reload the config, keeping the current one: {e}")
+        return
+    message = f"Config reloaded, applied: {', '.join(applied) or 'nothing'}."
+    if pending:
+        message += f" Restart to apply: {', '.join(pending)}."
+    await ctx.send(message)
 
 
 async def main():
     async with bot:
-        await bot.start(read_config("token"))
+        await bot.start(bot.config.token)
 
 
 if __name__ == "__main__":
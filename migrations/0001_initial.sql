@@ -5,7 +5,6 @@ CREATE TABLE IF NOT EXISTS topics
     title TEXT NOT NULL,
     message TEXT NOT NULL,
     priority_level INT NOT NULL,
-    users_in_favor BIGINT[],
     message_id BIGINT NOT NULL,
     author_id BIGINT NOT NULL,
     thread_id BIGINT NOT NULL
@@ -0,0 +1,24 @@
+CREATE TABLE IF NOT EXISTS topic_votes
+(
+    topic_id BIGINT NOT NULL REFERENCES topics (id) ON DELETE CASCADE,
+    user_id BIGINT NOT NULL,
+    PRIMARY KEY (topic_id, user_id)
+);
+
+-- Votes used to be stored in topics.users_in_favor, move them over and drop the array.
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'topics' AND column_name = 'users_in_favor'
+    ) THEN
+        INSERT INTO topic_votes (topic_id, user_id)
+        SELECT id, unnest(users_in_favor) FROM topics
+        ON CONFLICT DO NOTHING;
+        UPDATE topics SET priority_level = (
+            SELECT count(*) FROM topic_votes WHERE topic_votes.topic_id = topics.id
+        );
+        ALTER TABLE topics DROP COLUMN users_in_favor;
+    END IF;
+END
+$$;
@@ -0,0 +1,4 @@
+-- Lookups done by the topic commands and buttons
+CREATE INDEX IF NOT EXISTS topics_thread_id_idx ON topics (thread_id);
+CREATE INDEX IF NOT EXISTS topics_guild_author_idx ON topics (guild_id, author_id);
+CREATE INDEX IF NOT EXISTS topics_guild_priority_idx ON topics (guild_id, priority_level DESC);
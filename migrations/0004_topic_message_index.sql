@@ -0,0 +1,2 @@
+-- Buttons posted under the old custom_id scheme are resolved to their topic by message id
+CREATE INDEX IF NOT EXISTS topics_message_id_idx ON topics (message_id);
@@ -0,0 +1,2 @@
+-- Message in the priority counting thread that holds the rendered leaderboard
+ALTER TABLE settings ADD COLUMN IF NOT EXISTS priority_message_id BIGINT;
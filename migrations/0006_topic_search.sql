@@ -0,0 +1,6 @@
+-- Full text search over topic titles and messages, titles weigh more in the ranking
+ALTER TABLE topics ADD COLUMN IF NOT EXISTS search TSVECTOR GENERATED ALWAYS AS (
+    setweight(to_tsvector('english'::REGCONFIG, title), 'A') ||
+    setweight(to_tsvector('english'::REGCONFIG, message), 'B')
+) STORED;
+CREATE INDEX IF NOT EXISTS topics_search_idx ON topics USING GIN (search);
@@ -0,0 +1,41 @@
+-- Closed topics, partitioned by month of closing so old months can be detached or dropped cheaply:
+--   ALTER TABLE topics_archive DETACH PARTITION topics_archive_y2024m01;
+CREATE TABLE IF NOT EXISTS topics_archive
+(
+    id BIGINT NOT NULL,
+    guild_id BIGINT NOT NULL,
+    title TEXT NOT NULL,
+    message TEXT NOT NULL,
+    priority_level INT NOT NULL,
+    message_id BIGINT NOT NULL,
+    author_id BIGINT NOT NULL,
+    thread_id BIGINT NOT NULL,
+    voter_ids BIGINT[] NOT NULL,
+    closed_by TEXT NOT NULL,
+    closer_id BIGINT NOT NULL,
+    remarks TEXT NOT NULL,
+    closed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (id, closed_at)
+) PARTITION BY RANGE (closed_at);
+
+-- Catches rows for months that have no partition yet
+CREATE TABLE IF NOT EXISTS topics_archive_default PARTITION OF topics_archive DEFAULT;
+
+CREATE INDEX IF NOT EXISTS topics_archive_guild_closed_idx ON topics_archive (guild_id, closed_at DESC, id DESC);
+
+-- Creates the partition holding the given month (in UTC) unless it exists, the bot keeps the next month ready
+CREATE OR REPLACE FUNCTION ensure_topics_archive_partition(month DATE) RETURNS VOID AS $$
+DECLARE
+    first_day DATE := date_trunc('month', month)::DATE;
+    partition_name TEXT := 'topics_archive_' || to_char(first_day, '"y"YYYY"m"MM');
+BEGIN
+    IF to_regclass(partition_name) IS NULL THEN
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF topics_archive FOR VALUES FROM (%L) TO (%L)',
+            partition_name,
+            first_day::TIMESTAMP AT TIME ZONE 'UTC',
+            (first_day + INTERVAL '1 month')::TIMESTAMP AT TIME ZONE 'UTC'
+        );
+    END IF;
+END
+$$ LANGUAGE plpgsql;
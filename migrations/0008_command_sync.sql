@@ -0,0 +1,8 @@
+-- The application command payload last synced to Discord, scope 0 is the global commands and anything else a guild id
+CREATE TABLE IF NOT EXISTS command_sync
+(
+    scope BIGINT PRIMARY KEY,
+    hash TEXT NOT NULL,
+    payload JSONB NOT NULL,
+    synced_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
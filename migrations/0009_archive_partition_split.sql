@@ -0,0 +1,33 @@
+-- A month's partition can't be created while the default partition holds rows for it, which happens when topics were
+-- closed before the partition existed. The partition is now built as a plain table, the month's rows are moved out
+-- of the default partition into it, and then it is attached.
+CREATE OR REPLACE FUNCTION ensure_topics_archive_partition(month DATE) RETURNS VOID AS $$
+DECLARE
+    first_day DATE := date_trunc('month', month)::DATE;
+    partition_name TEXT := 'topics_archive_' || to_char(first_day, '"y"YYYY"m"MM');
+    range_start TIMESTAMPTZ := first_day::TIMESTAMP AT TIME ZONE 'UTC';
+    range_end TIMESTAMPTZ := (first_day + INTERVAL '1 month')::TIMESTAMP AT TIME ZONE 'UTC';
+BEGIN
+    IF to_regclass(partition_name) IS NULL THEN
+        EXECUTE format(
+            'CREATE TABLE %I (LIKE topics_archive INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+            partition_name
+        );
+        EXECUTE format(
+            'WITH moved AS (
+                 DELETE FROM topics_archive_default WHERE closed_at >= %L AND closed_at < %L RETURNING *
+             )
+             INSERT INTO %I SELECT * FROM moved',
+            range_start,
+            range_end,
+            partition_name
+        );
+        EXECUTE format(
+            'ALTER TABLE topics_archive ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+            partition_name,
+            range_start,
+            range_end
+        );
+    END IF;
+END
+$$ LANGUAGE plpgsql;
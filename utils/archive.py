@@ -0,0 +1,48 @@
+from __future__ import annotations
+import asyncio
+from datetime import date, datetime, timezone
+from utils import queries
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from main import ModMailInternal
+
+CHECK_INTERVAL = 6 * 60 * 60
+
+
+def next_month(day: date) -> date:
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+class ArchivePartitions:
+    """Keeps a partition of topics_archive ready for this month and the next.
+
+    Creating a month's partition ahead of time keeps closed topics out of the default partition,
+    which would otherwise have to be split when the partition is finally created.
+    """
+
+    def __init__(self, bot: ModMailInternal) -> None:
+        self.bot = bot
+        self._task: Optional[asyncio.Task[None]] = None
+
+    async def ensure(self) -> None:
+        this_month = datetime.now(timezone.utc).date().replace(day=1)
+        for month in (this_month, next_month(this_month)):
+            await self.bot.db.execute(queries.ARCHIVE_ENSURE_PARTITION, month)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._ensure_loop())
+
+    async def _ensure_loop(self) -> None:
+        while True:
+            try:
+                await self.ensure()
+            except Exception:
+                self.bot.log.exception("Unable to create topics_archive partitions")
+            await asyncio.sleep(CHECK_INTERVAL)
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
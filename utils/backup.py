@@ -0,0 +1,217 @@
+from __future__ import annotations
+import json
+import asyncpg
+from utils import queries
+from datetime import datetime, timezone
+from typing import IO, Any, Callable, Dict, Iterable, List, NamedTuple, Set, Tuple
+
+# Bumped when the layout of a backup changes in a way older restores can't read
+FORMAT_VERSION = 1
+# Rows handed to a single COPY while restoring, bounds the memory a restore needs
+RESTORE_BATCH_SIZE = 1000
+
+_TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+
+class BackupError(Exception):
+    """The file isn't a backup this bot can restore"""
+
+
+class Table(NamedTuple):
+    """A table holding guild data and how to pick out one guild's rows, $1 being the guild id"""
+
+    name: str
+    columns: Tuple[str, ...]
+    where: str = "guild_id = $1"
+
+
+# In restore order, topic_votes references topics
+TABLES = (
+    Table(
+        "settings",
+        (
+            "guild_id",
+            "output_channel_id",
+            "allowed_role_ids",
+            "priority_counting_thread",
+            "priority_message_id",
+        ),
+    ),
+    Table(
+        "topics",
+        (
+            "id",
+            "guild_id",
+            "title",
+            "message",
+            "priority_level",
+            "message_id",
+            "author_id",
+            "thread_id",
+        ),
+    ),
+    Table(
+        "topic_votes",
+        ("topic_id", "user_id"),
+        "topic_id IN (SELECT id FROM topics WHERE guild_id = $1)",
+    ),
+    Table(
+        "topics_archive",
+        (
+            "id",
+            "guild_id",
+            "title",
+            "message",
+            "priority_level",
+            "message_id",
+            "author_id",
+            "thread_id",
+            "voter_ids",
+            "closed_by",
+            "closer_id",
+            "remarks",
+            "closed_at",
+        ),
+    ),
+)
+_TABLES_BY_NAME = {table.name: table for table in TABLES}
+
+# JSON has no timestamp type, these columns are written in a fixed UTC format and parsed back on restore
+_JSON_EXPRESSIONS = {
+    "closed_at": "to_char(closed_at AT TIME ZONE 'UTC', 'YYYY-MM-DD\"T\"HH24:MI:SS.US') AS closed_at"
+}
+_JSON_DECODERS: Dict[str, Callable[[Any], Any]] = {
+    "closed_at": lambda value: datetime.strptime(value, _TIMESTAMP_FORMAT).replace(
+        tzinfo=timezone.utc
+    )
+}
+
+
+def _json_query(table: Table) -> str:
+    columns = ", ".join(_JSON_EXPRESSIONS.get(c, c) for c in table.columns)
+    return (
+        f"SELECT json_build_object('table', '{table.name}', 'row', row_to_json(r)) "
+        f"FROM (SELECT {columns} FROM {table.name} WHERE {table.where}) r"
+    )
+
+
+def _csv_query(table: Table) -> str:
+    return f"SELECT {', '.join(table.columns)} FROM {table.name} WHERE {table.where}"
+
+
+async def export_guild(
+    con: asyncpg.Connection, guild_id: int, output: IO[bytes]
+) -> None:
+    """Writes a guild's settings, topics, votes and archive to `output` as JSON lines.
+
+    Rows are streamed from the server with COPY and written as they arrive, they are never held in Python.
+    The first line is a header naming the guild, every other line is one row: {"table": ..., "row": {...}}.
+    """
+    header = {"format": FORMAT_VERSION, "guild_id": guild_id}
+    output.write(json.dumps(header).encode() + b"\n")
+    # One snapshot for every table, so votes can't refer to a topic closed halfway through
+    async with con.transaction(isolation="repeatable_read", readonly=True):
+        for table in TABLES:
+            # CSV with a quote and delimiter that never appear in JSON writes each object as is,
+            # the text format would escape every backslash in it
+            await con.copy_from_query(
+                _json_query(table),
+                guild_id,
+                output=output,
+                format="csv",
+                delimiter="\x02",
+                quote="\x01",
+            )
+
+
+async def export_guild_csv(
+    con: asyncpg.Connection, guild_id: int, outputs: Dict[str, IO[bytes]]
+) -> None:
+    """Writes a guild's rows as one CSV file per table, for reading in a spreadsheet. `outputs` is keyed by table name"""
+    async with con.transaction(isolation="repeatable_read", readonly=True):
+        for table in TABLES:
+            await con.copy_from_query(
+                _csv_query(table),
+                guild_id,
+                output=outputs[table.name],
+                format="csv",
+                header=True,
+            )
+
+
+def read_header(source: IO[bytes]) -> Dict[str, Any]:
+    """Reads and checks the first line of a JSON lines backup"""
+    try:
+        header = json.loads(source.readline())
+    except ValueError:
+        raise BackupError("The file is not a JSON lines backup.")
+    if not isinstance(header, dict) or "guild_id" not in header:
+        raise BackupError("The file is not a JSON lines backup.")
+    if header.get("format", 0) > FORMAT_VERSION:
+        raise BackupError("The backup was made by a newer version of the bot.")
+    return header
+
+
+def _records(source: IO[bytes]) -> Iterable[Tuple[Table, Tuple[Any, ...]]]:
+    for number, line in enumerate(source, start=2):
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+            table = _TABLES_BY_NAME[entry["table"]]
+            row = entry["row"]
+            record = tuple(
+                _JSON_DECODERS[c](row[c]) if c in _JSON_DECODERS else row[c]
+                for c in table.columns
+            )
+        except (ValueError, KeyError, TypeError):
+            raise BackupError(f"Line {number} of the backup is not a valid row.")
+        yield table, record
+
+
+async def restore_guild(
+    con: asyncpg.Connection, guild_id: int, source: IO[bytes]
+) -> Dict[str, int]:
+    """Replaces a guild's data with the rows of a JSON lines backup, the header must already have been read.
+
+    Everything happens in one transaction, a backup that fails halfway leaves the guild's current data in place.
+    Rows are copied in batches as the file is read. Returns how many rows each table got.
+    """
+    counts = {table.name: 0 for table in TABLES}
+    async with con.transaction():
+        # Votes go with their topics
+        for table in ("topics_archive", "topics", "settings"):
+            await con.execute(f"DELETE FROM {table} WHERE guild_id = $1", guild_id)
+
+        batch: List[Tuple[Any, ...]] = []
+        current = None
+        # Votes may only point at topics restored from this same file, topics come first
+        topic_ids: Set[int] = set()
+
+        async def flush() -> None:
+            if batch:
+                await con.copy_records_to_table(
+                    current.name, records=batch, columns=current.columns
+                )
+                counts[current.name] += len(batch)
+                batch.clear()
+
+        for table, record in _records(source):
+            if table is not current or len(batch) >= RESTORE_BATCH_SIZE:
+                await flush()
+                current = table
+            if table.name == "topic_votes":
+                if record[0] not in topic_ids:
+                    raise BackupError(
+                        "The backup holds votes for topics it doesn't contain."
+                    )
+            elif record[table.columns.index("guild_id")] != guild_id:
+                raise BackupError("The backup holds rows of another server.")
+            elif table.name == "topics":
+                topic_ids.add(record[0])
+            batch.append(record)
+        await flush()
+        # Priorities are counted from the restored votes rather than trusted from the file
+        if topic_ids:
+            await con.execute(queries.VOTE_RECOUNT.sql, list(topic_ids))
+    return counts
@@ -0,0 +1,225 @@
+from __future__ import annotations
+import asyncio
+import asyncpg
+import time
+from collections import OrderedDict
+from utils import queries
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+if TYPE_CHECKING:
+    from main import ModMailInternal
+
+
+class GuildSettings:
+    """A cached copy of a guild's row in the settings table."""
+
+    __slots__ = (
+        "guild_id",
+        "output_channel_id",
+        "allowed_role_ids",
+        "allowed_roles",
+        "priority_counting_thread",
+        "priority_message_id",
+    )
+
+    def __init__(
+        self,
+        guild_id: int,
+        output_channel_id: Optional[int] = None,
+        allowed_role_ids: Tuple[int, ...] = (),
+        priority_counting_thread: Optional[int] = None,
+        priority_message_id: Optional[int] = None,
+    ) -> None:
+        self.guild_id = guild_id
+        self.output_channel_id = output_channel_id
+        self.allowed_role_ids = allowed_role_ids
+        # Built once per settings change so the whitelist check is a set lookup
+        self.allowed_roles = frozenset(allowed_role_ids)
+        self.priority_counting_thread = priority_counting_thread
+        self.priority_message_id = priority_message_id
+
+    @classmethod
+    def from_record(cls, record: asyncpg.Record) -> GuildSettings:
+        return cls(
+            record["guild_id"],
+            record["output_channel_id"],
+            tuple(record["allowed_role_ids"] or ()),
+            record["priority_counting_thread"],
+            record["priority_message_id"],
+        )
+
+
+class SettingsCache:
+    """Keeps each guild's settings row in memory so checks and commands don't have to hit the database.
+
+    Guilds without a settings row are cached as well so they don't cost a query every time either.
+    Anything that writes to the settings table must call `store` or `invalidate` afterwards.
+    With a `ttl` entries are also reloaded once they are older than `ttl` seconds, to pick up edits made outside the bot.
+    """
+
+    def __init__(self, bot: ModMailInternal, ttl: Optional[float] = None) -> None:
+        self.bot = bot
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[int, GuildSettings] = {}
+        self._stored_at: Dict[int, float] = {}
+        self._pending: Dict[int, asyncio.Task[GuildSettings]] = {}
+
+    async def get(self, guild_id: int) -> GuildSettings:
+        """Gets the settings for a guild, loading them from the database the first time"""
+        entry = self._entries.get(guild_id)
+        if entry is not None and not self._expired(guild_id):
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        # Concurrent misses for the same guild share a single query
+        task = self._pending.get(guild_id)
+        if task is None:
+            task = asyncio.create_task(self._load(guild_id))
+            self._pending[guild_id] = task
+            task.add_done_callback(lambda _: self._pending.pop(guild_id, None))
+        return await asyncio.shield(task)
+
+    def _expired(self, guild_id: int) -> bool:
+        return (
+            self.ttl is not None
+            and time.monotonic() - self._stored_at[guild_id] > self.ttl
+        )
+
+    async def _load(self, guild_id: int) -> GuildSettings:
+        started = time.monotonic()
+        record = await self.bot.db.fetchrow(queries.SETTINGS_GET, guild_id)
+        # A write that landed while we were loading is newer than what we read
+        if self._stored_at.get(guild_id, -1.0) >= started:
+            return self._entries[guild_id]
+        entry = GuildSettings.from_record(record) if record else GuildSettings(guild_id)
+        return self._put(entry)
+
+    def _put(self, entry: GuildSettings) -> GuildSettings:
+        self._entries[entry.guild_id] = entry
+        self._stored_at[entry.guild_id] = time.monotonic()
+        return entry
+
+    def store(self, record: asyncpg.Record) -> GuildSettings:
+        """Replaces the cached settings with a freshly written row"""
+        return self._put(GuildSettings.from_record(record))
+
+    def invalidate(self, guild_id: Optional[int] = None) -> None:
+        """Drops a guild's cached settings, or every guild's if no id is given"""
+        if guild_id is None:
+            self._entries.clear()
+            self._stored_at.clear()
+        else:
+            self._entries.pop(guild_id, None)
+            self._stored_at.pop(guild_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+class TTLCache:
+    """A small dict cache whose entries expire after `ttl` seconds, evicting the least recently used past `maxsize`"""
+
+    def __init__(self, ttl: float, maxsize: int = 1024) -> None:
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        # key -> (expires at, value), oldest use first
+        self._entries: OrderedDict[Hashable, Tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self.misses += 1
+            self._entries.pop(key, None)
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def discard(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+
+    def discard_where(self, predicate: Callable[[Hashable], bool]) -> None:
+        """Drops every entry whose key matches"""
+        for key in [k for k in self._entries if predicate(k)]:
+            del self._entries[key]
+
+
+class TopicChoice(NamedTuple):
+    thread_id: int
+    title: str
+    words: Tuple[str, ...]
+
+
+class TopicChoices:
+    """Open topics to suggest in autocomplete, cached per (guild, author) for the caller's own topics
+    and per guild for admins, who can pick any topic.
+    """
+
+    def __init__(self, bot: ModMailInternal, ttl: float, limit: int = 1000) -> None:
+        self.bot = bot
+        self.limit = limit
+        self.cache = TTLCache(ttl)
+
+    async def get(self, guild_id: int, author_id: Optional[int]) -> List[TopicChoice]:
+        """Topics of one author, or of everyone when `author_id` is None, highest priority first"""
+        key = (guild_id, author_id)
+        choices = self.cache.get(key)
+        if choices is None:
+            if author_id is None:
+                records = await self.bot.db.fetch(
+                    queries.TOPIC_CHOICES, guild_id, self.limit
+                )
+            else:
+                records = await self.bot.db.fetch(
+                    queries.TOPIC_CHOICES_BY_AUTHOR, guild_id, author_id, self.limit
+                )
+            choices = [
+                TopicChoice(
+                    r["thread_id"], r["title"], tuple(r["title"].casefold().split())
+                )
+                for r in records
+            ]
+            self.cache.set(key, choices)
+        return choices
+
+    async def matching(
+        self, guild_id: int, author_id: Optional[int], prefix: str, limit: int = 25
+    ) -> List[TopicChoice]:
+        """Topics with a title, or a word in it, that starts with `prefix`"""
+        prefix = prefix.casefold().strip()
+        matches = []
+        for choice in await self.get(guild_id, author_id):
+            if (
+                not prefix
+                or choice.title.casefold().startswith(prefix)
+                or any(word.startswith(prefix) for word in choice.words)
+            ):
+                matches.append(choice)
+                if len(matches) == limit:
+                    break
+        return matches
+
+    def invalidate(self, guild_id: int) -> None:
+        """Drops every cached list of a guild, for when a topic is created, renamed or closed"""
+        self.cache.discard_where(lambda key: key[0] == guild_id)
@@ -1,30 +1,23 @@
 from __future__ import annotations
 import discord
 from discord import app_commands
-import asyncpg
 from . import errors
-from typing import TYPE_CHECKING, Optional
+from typing import TYPE_CHECKING, Optional, Tuple
 
 if TYPE_CHECKING:
     from main import ModMailInternal
+    from utils.topics import TopicRecord
 
 
 def topic_whitelist():
     async def wrapper(interaction: discord.Interaction):
         """Verifies an topic command can be used"""
-        # Get data from settings table in db
-        con: asyncpg.Connection
+        # Get data from the cached settings row
         bot: ModMailInternal = interaction.client
-        async with bot.db.acquire() as con:
-            role_ids = await con.fetchval(
-                "SELECT allowed_role_ids FROM settings WHERE guild_id = $1",
-                interaction.guild_id,
-            )
-            channel_id = await con.fetchval(
-                "SELECT output_channel_id FROM settings WHERE guild_id = $1",
-                interaction.guild_id,
-            )
-            channel: discord.ForumChannel = interaction.guild.get_channel(channel_id)
+        settings = await bot.settings_cache.get(interaction.guild_id)
+        channel: discord.ForumChannel = interaction.guild.get_channel(
+            settings.output_channel_id
+        )
 
         if not channel:
             bot.log.warning(
@@ -32,20 +25,16 @@ def topic_whitelist():
             )
             raise errors.NoChannelError("No channel set or channel has been deleted")
 
-        if interaction.user.guild_permissions.administrator == True:
+        # Resolved from the interaction payload, so this works without a member cache
+        if interaction.permissions.administrator:
             return True
 
-        if not role_ids:
+        if not settings.allowed_roles:
             raise errors.NoRolesError(
                 "No roles set, please have an admin set a role to use these commands"
             )
-        roles = [
-            interaction.guild.get_role(rid)
-            for rid in role_ids
-            if interaction.guild.get_role(rid) is not None
-        ]
-        set_intersection = set(roles) & set(interaction.user.roles)
-        if not set_intersection:
+        # Only the whitelisted roles are looked up on the member, the guild's roles are cached in every gateway mode
+        if not any(map(interaction.user.get_role, settings.allowed_roles)):
             raise errors.NotWhitelistedError("You cannot use this command.")
 
         return True
@@ -56,10 +45,14 @@ def topic_whitelist():
 async def validate_thread(
     bot: ModMailInternal,
     interaction: discord.Interaction,
-    thread: discord.Thread = None,
-) -> Optional[discord.Thread]:
-    """Validates a thread exists and is valid. If it isn't returns None. if it is, returns the thread."""
-    if not thread:
+    thread_id: Optional[str] = None,
+) -> Optional[Tuple[discord.Thread, TopicRecord]]:
+    """Resolves a topic thread and its topic row. If it isn't a topic, responds and returns None.
+
+    `thread_id` is the value picked from autocomplete, without one the current channel is used.
+    Whether a thread is a topic is decided by its row, so archived threads work as well.
+    """
+    if not thread_id:
         thread = interaction.channel
         if not isinstance(thread, discord.Thread):
             await interaction.response.send_message(
@@ -67,28 +60,44 @@ async def validate_thread(
                 ephemeral=True,
             )
             return None
+        topic = await bot.topics.by_thread(interaction, thread.id)
+    else:
+        topic = None
+        if thread_id.isdigit():
+            topic = await bot.topics.by_thread(interaction, int(thread_id))
+        if topic is None:
+            await interaction.response.send_message(
+                "That isn't a topic thread, please pick one from the list.",
+                ephemeral=True,
+            )
+            return None
+        thread = await resolve_thread(interaction.guild, thread_id)
+        if thread is None:
+            await interaction.response.send_message(
+                "The thread of that topic no longer exists.", ephemeral=True
+            )
+            return None
 
-    forum_id = await bot.db.fetchval(
-        "SELECT output_channel_id FROM settings WHERE guild_id = $1",
-        interaction.guild_id,
-    )
-    if not forum_id:
+    if topic is None:
         await interaction.response.send_message(
-            "Topic forum doesn't exist. Please have an admin make one.",
+            "This thread is not a topic thread. Please select a valid thread",
             ephemeral=True,
         )
         return None
-    forum = interaction.guild.get_channel(forum_id)
-    if not forum:
-        return await interaction.response.send_message(
-            "Topic forum doesn't exist or was deleted. Please have an admin remake one.",
-            ephemeral=True,
-        )
+    return thread, topic
 
-    if thread not in forum.threads:
-        await interaction.response.send_message(
-            "This thread is not a topic thread. Please select a valid thread",
-            ephemeral=True,
-        )
+
+async def resolve_thread(
+    guild: discord.Guild, thread_id: str
+) -> Optional[discord.Thread]:
+    """Gets a thread from its id as typed or picked in a command option"""
+    if not thread_id.isdigit():
         return None
-    return thread
+    thread = guild.get_channel_or_thread(int(thread_id))
+    if thread is None:
+        # Archived threads aren't cached
+        try:
+            thread = await guild.fetch_channel(int(thread_id))
+        except (discord.NotFound, discord.Forbidden):
+            return None
+    return thread if isinstance(thread, discord.Thread) else None
@@ -0,0 +1,67 @@
+from __future__ import annotations
+import os
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# The cluster launcher hands each worker its shards through these
+ENV_CLUSTER_ID = "MMI_CLUSTER_ID"
+ENV_CLUSTER_COUNT = "MMI_CLUSTER_COUNT"
+ENV_SHARD_IDS = "MMI_SHARD_IDS"
+ENV_SHARD_COUNT = "MMI_SHARD_COUNT"
+
+
+class ClusterInfo(NamedTuple):
+    """Which shards this process runs. The defaults are a single process running every shard"""
+
+    cluster_id: int = 0
+    cluster_count: int = 1
+    shard_ids: Optional[Tuple[int, ...]] = None
+    shard_count: Optional[int] = None
+
+    @property
+    def is_primary(self) -> bool:
+        """Housekeeping that isn't tied to a guild runs on the primary cluster only"""
+        return self.cluster_id == 0
+
+    @property
+    def clustered(self) -> bool:
+        return self.cluster_count > 1
+
+    @classmethod
+    def from_env(cls) -> ClusterInfo:
+        if ENV_SHARD_IDS not in os.environ:
+            return cls()
+        return cls(
+            int(os.environ[ENV_CLUSTER_ID]),
+            int(os.environ[ENV_CLUSTER_COUNT]),
+            tuple(int(s) for s in os.environ[ENV_SHARD_IDS].split(",")),
+            int(os.environ[ENV_SHARD_COUNT]),
+        )
+
+    def to_env(self) -> Dict[str, str]:
+        return {
+            ENV_CLUSTER_ID: str(self.cluster_id),
+            ENV_CLUSTER_COUNT: str(self.cluster_count),
+            ENV_SHARD_IDS: ",".join(str(s) for s in self.shard_ids),
+            ENV_SHARD_COUNT: str(self.shard_count),
+        }
+
+
+def plan_clusters(shard_count: int, cluster_count: int) -> List[ClusterInfo]:
+    """Splits the shards into contiguous, evenly sized ranges, one per cluster"""
+    cluster_count = min(cluster_count, shard_count)
+    per_cluster, extra = divmod(shard_count, cluster_count)
+    clusters = []
+    start = 0
+    for cluster_id in range(cluster_count):
+        size = per_cluster + (1 if cluster_id < extra else 0)
+        clusters.append(
+            ClusterInfo(
+                cluster_id,
+                cluster_count,
+                tuple(range(start, start + size)),
+                shard_count,
+            )
+        )
+        start += size
+    return clusters
+
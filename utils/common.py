@@ -1,9 +1,8 @@
 from __future__ import annotations
-import os
-from logzero import setup_logger
 from logging import Logger
 from typing import TYPE_CHECKING
-
+from utils import queries
+from utils.logs import get_logger
 
 if TYPE_CHECKING:
     from main import ModMailInternal
@@ -11,17 +10,9 @@ if TYPE_CHECKING:
 
 def configure_logging(filename: str) -> Logger:
     """Configure logging for main bot and each cog."""
-    log_path = "data/logs/"
-    if not os.path.isdir(log_path):
-        os.mkdir(log_path)
-    return setup_logger(
-        name=filename, logfile=log_path + filename + ".log", maxBytes=100000
-    )
+    return get_logger(filename)
 
 
 async def set_guild(bot: ModMailInternal, guild_id: int):
-    """Checks if a guild is in the settings database"""
-    if not await bot.db.fetchval(
-        "SELECT guild_id FROM settings WHERE guild_id = $1", guild_id
-    ):
-        await bot.db.execute("INSERT INTO settings (guild_id) VALUES ($1)", guild_id)
+    """Makes sure a guild has a row in the settings database"""
+    await bot.db.execute(queries.SETTINGS_ENSURE, guild_id)
@@ -0,0 +1,129 @@
+from __future__ import annotations
+import yaml
+from typing import (
+    Any,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Union,
+    get_args,
+    get_origin,
+    get_type_hints,
+)
+
+CONFIG_PATH = "data/config.yml"
+
+
+class ConfigError(Exception):
+    """The config file is missing a required key or has a value of the wrong type"""
+
+
+class PoolConfig(NamedTuple):
+    min_size: int = 2
+    max_size: int = 10
+    statement_cache_size: int = 128
+    max_inactive_connection_lifetime: float = 300.0
+    # Applies to every call on a pooled connection, migrations and backup COPYs included, so unset by default
+    command_timeout: Optional[float] = None
+    server_settings: Dict[str, str] = {
+        "application_name": "mod-mail-internal",
+        "jit": "off",
+    }
+
+
+class Config(NamedTuple):
+    """The parsed contents of data/config.yml"""
+
+    token: str
+    db: str
+    prefix: str
+    activity: str
+    pool: PoolConfig = PoolConfig()
+    view_mode: str = "dynamic"
+    view_restore_batch_size: int = 500
+    leaderboard_delay: float = 5.0
+    leaderboard_size: int = 25
+    vote_write_behind: bool = False
+    vote_flush_interval: float = 2.0
+    settings_cache_ttl: Optional[float] = None
+    autocomplete_cache_ttl: float = 30.0
+    gateway_mode: str = "full"
+    shard_count: Optional[int] = None
+    cluster_count: int = 1
+    startup_target: float = 10.0
+    reconcile_interval: Optional[float] = 30.0
+    reconcile_batch_size: int = 25
+    metrics_port: Optional[int] = None
+    metrics_host: str = "127.0.0.1"
+    log_max_bytes: int = 1_000_000
+    log_backup_count: int = 5
+    log_json: bool = False
+    log_queue_size: int = 10_000
+
+
+# Keys that take effect on reload, everything else is only read on startup
+RELOADABLE = frozenset(
+    {
+        "prefix",
+        "activity",
+        "leaderboard_delay",
+        "leaderboard_size",
+        "vote_flush_interval",
+        "settings_cache_ttl",
+        "autocomplete_cache_ttl",
+    }
+)
+
+_CHOICES = {"view_mode": ("dynamic", "legacy"), "gateway_mode": ("full", "lean")}
+
+
+def _coerce(key: str, value: Any, expected: Any) -> Any:
+    """Checks a value against the annotated type, allowing ints where floats are expected"""
+    if get_origin(expected) is Union:
+        if value is None:
+            return None
+        expected = get_args(expected)[0]
+    expected = get_origin(expected) or expected
+    types = (int, float) if expected is float else (expected,)
+    # bool is a subclass of int but a yes/no is never a valid number
+    if not isinstance(value, types) or (
+        isinstance(value, bool) and expected is not bool
+    ):
+        raise ConfigError(f"`{key}` must be {expected.__name__}, got {value!r}")
+    if key in _CHOICES and value not in _CHOICES[key]:
+        raise ConfigError(f"`{key}` must be one of {', '.join(_CHOICES[key])}")
+    return float(value) if expected is float else value
+
+
+def _parse(cls: Any, raw: Dict[str, Any], prefix: str = "") -> Any:
+    if not isinstance(raw, dict):
+        raise ConfigError(f"`{prefix.rstrip('.') or 'config'}` must be a mapping")
+    unknown = set(raw) - set(cls._fields)
+    if unknown:
+        raise ConfigError(
+            f"Unknown config keys: {', '.join(prefix + k for k in sorted(unknown))}"
+        )
+    hints = get_type_hints(cls)
+    values = {}
+    for key in cls._fields:
+        if key not in raw:
+            if key not in cls._field_defaults:
+                raise ConfigError(f"`{prefix}{key}` is required")
+            continue
+        if hints[key] is PoolConfig:
+            values[key] = _parse(PoolConfig, raw[key] or {}, key + ".")
+        else:
+            values[key] = _coerce(prefix + key, raw[key], hints[key])
+    return cls(**values)
+
+
+def load_config(path: str = CONFIG_PATH) -> Config:
+    """Reads and validates the config file"""
+    with open(path, "r") as f:
+        raw = yaml.safe_load(f) or {}
+    return _parse(Config, raw)
+
+
+def changed_keys(old: Config, new: Config) -> List[str]:
+    return [key for key in Config._fields if getattr(old, key) != getattr(new, key)]
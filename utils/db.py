@@ -0,0 +1,176 @@
+from __future__ import annotations
+import time
+import asyncpg
+from contextlib import asynccontextmanager
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+from utils.config import PoolConfig
+from utils.queries import Statement
+
+if TYPE_CHECKING:
+    from utils.metrics import Metrics
+
+# Anything not registered in utils.queries is counted under this name
+ADHOC = "adhoc"
+
+
+async def create_pool(dsn: str, options: PoolConfig = PoolConfig()) -> asyncpg.Pool:
+    """Creates the asyncpg pool with the tuning options from the config"""
+    return await asyncpg.create_pool(dsn, **options._asdict())
+
+
+class StatementStats:
+    """Call count and total time per statement name"""
+
+    def __init__(self) -> None:
+        self.calls: Dict[str, int] = {}
+        self.seconds: Dict[str, float] = {}
+
+    def record(self, name: str, elapsed: float) -> None:
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.seconds[name] = self.seconds.get(name, 0.0) + elapsed
+
+    @property
+    def total(self) -> int:
+        return sum(self.calls.values())
+
+
+class _Executor:
+    """Query methods shared by the pool wrapper and transactions, resolving, counting and timing each statement"""
+
+    stats: StatementStats
+
+    async def _connection_call(
+        self,
+        con: asyncpg.Connection,
+        method: str,
+        statement: Union[Statement, str],
+        args: Tuple[Any, ...],
+        kwargs: Dict[str, Any],
+    ) -> Any:
+        if isinstance(statement, Statement):
+            name, sql = statement
+        else:
+            name, sql = ADHOC, statement
+        start = time.perf_counter()
+        try:
+            return await getattr(con, method)(sql, *args, **kwargs)
+        finally:
+            self.stats.record(name, time.perf_counter() - start)
+
+
+class Transaction(_Executor):
+    """Runs statements on a single connection inside a transaction"""
+
+    def __init__(self, con: asyncpg.Connection, stats: StatementStats) -> None:
+        self.con = con
+        self.stats = stats
+
+    async def fetch(
+        self, statement: Statement, *args: Any, **kwargs: Any
+    ) -> List[asyncpg.Record]:
+        return await self._connection_call(self.con, "fetch", statement, args, kwargs)
+
+    async def fetchrow(
+        self, statement: Statement, *args: Any, **kwargs: Any
+    ) -> Optional[asyncpg.Record]:
+        return await self._connection_call(
+            self.con, "fetchrow", statement, args, kwargs
+        )
+
+    async def fetchval(self, statement: Statement, *args: Any, **kwargs: Any) -> Any:
+        return await self._connection_call(
+            self.con, "fetchval", statement, args, kwargs
+        )
+
+    async def execute(self, statement: Statement, *args: Any, **kwargs: Any) -> str:
+        return await self._connection_call(self.con, "execute", statement, args, kwargs)
+
+    async def executemany(self, statement: Statement, args: Any, **kwargs: Any) -> None:
+        return await self._connection_call(
+            self.con, "executemany", statement, (args,), kwargs
+        )
+
+    async def cursor(
+        self, statement: Statement, *args: Any, **kwargs: Any
+    ) -> asyncpg.cursor.Cursor:
+        """Opens a server side cursor, only the call that opens it is counted"""
+        return await self._connection_call(self.con, "cursor", statement, args, kwargs)
+
+
+class Database(_Executor):
+    """Wrapper around the asyncpg pool that every query goes through.
+
+    Statements from `utils.queries` are counted and timed by name and time spent waiting for a connection is measured.
+    """
+
+    def __init__(self, pool: asyncpg.Pool, metrics: Metrics) -> None:
+        self.pool = pool
+        self.metrics = metrics
+        self.stats = StatementStats()
+
+    @property
+    def round_trips(self) -> int:
+        return self.stats.total
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[asyncpg.Connection]:
+        start = time.perf_counter()
+        async with self.pool.acquire() as con:
+            self.metrics.pool_acquire_wait.observe(time.perf_counter() - start)
+            yield con
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[Transaction]:
+        async with self.acquire() as con:
+            async with con.transaction():
+                yield Transaction(con, self.stats)
+
+    async def _call(
+        self,
+        method: str,
+        statement: Union[Statement, str],
+        args: Tuple[Any, ...],
+        kwargs: Dict[str, Any],
+    ) -> Any:
+        async with self.acquire() as con:
+            return await self._connection_call(con, method, statement, args, kwargs)
+
+    async def fetch(
+        self, statement: Statement, *args: Any, **kwargs: Any
+    ) -> List[asyncpg.Record]:
+        return await self._call("fetch", statement, args, kwargs)
+
+    async def fetchrow(
+        self, statement: Statement, *args: Any, **kwargs: Any
+    ) -> Optional[asyncpg.Record]:
+        return await self._call("fetchrow", statement, args, kwargs)
+
+    async def fetchval(self, statement: Statement, *args: Any, **kwargs: Any) -> Any:
+        return await self._call("fetchval", statement, args, kwargs)
+
+    async def execute(self, statement: Statement, *args: Any, **kwargs: Any) -> str:
+        return await self._call("execute", statement, args, kwargs)
+
+    async def executemany(self, statement: Statement, args: Any, **kwargs: Any) -> None:
+        return await self._call("executemany", statement, (args,), kwargs)
+
+    def get_size(self) -> int:
+        return self.pool.get_size()
+
+    def get_idle_size(self) -> int:
+        return self.pool.get_idle_size()
+
+    def get_max_size(self) -> int:
+        return self.pool.get_max_size()
+
+    async def close(self) -> None:
+        await self.pool.close()
@@ -0,0 +1,199 @@
+from __future__ import annotations
+import asyncio
+import bisect
+import discord
+from functools import partial
+from utils import queries
+from utils.outbound import Lane
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from main import ModMailInternal
+
+
+class GuildLeaderboard:
+    """Open topics of one guild ranked by priority, kept sorted as votes come in instead of re-sorting"""
+
+    def __init__(self) -> None:
+        # topic id -> (priority, thread id)
+        self._topics: Dict[int, Tuple[int, int]] = {}
+        # (-priority, topic id), sorted so the highest priority comes first
+        self._ranking: List[Tuple[int, int]] = []
+
+    def __len__(self) -> int:
+        return len(self._ranking)
+
+    def set(self, topic_id: int, thread_id: int, priority: int) -> None:
+        """Adds a topic or moves it to its new rank"""
+        self.remove(topic_id)
+        self._topics[topic_id] = (priority, thread_id)
+        bisect.insort(self._ranking, (-priority, topic_id))
+
+    def set_priority(self, topic_id: int, priority: int) -> bool:
+        """Moves a known topic to its new rank. Returns False if the topic isn't on the board"""
+        entry = self._topics.get(topic_id)
+        if entry is None:
+            return False
+        if entry[0] != priority:
+            self.set(topic_id, entry[1], priority)
+        return True
+
+    def remove(self, topic_id: int) -> None:
+        entry = self._topics.pop(topic_id, None)
+        if entry is None:
+            return
+        key = (-entry[0], topic_id)
+        del self._ranking[bisect.bisect_left(self._ranking, key)]
+
+    def top(self, limit: int) -> List[Tuple[int, int]]:
+        """Gets (thread id, priority) for the highest ranked topics"""
+        return [
+            (self._topics[topic_id][1], -neg_priority)
+            for neg_priority, topic_id in self._ranking[:limit]
+        ]
+
+
+class LeaderboardManager:
+    """Keeps a ranking per guild and renders it into the guild's priority counting thread.
+
+    Rankings are loaded from the database once per guild and then updated from topic and vote events.
+    Renders are debounced so a burst of votes results in a single message edit.
+    """
+
+    def __init__(self, bot: ModMailInternal, delay: float, size: int) -> None:
+        self.bot = bot
+        self.delay = delay
+        self.size = size
+        self._boards: Dict[int, GuildLeaderboard] = {}
+        self._loading: Dict[int, asyncio.Task[GuildLeaderboard]] = {}
+        self._renders: Dict[int, asyncio.Task[None]] = {}
+
+    async def board(self, guild_id: int) -> GuildLeaderboard:
+        """Gets a guild's ranking, loading it the first time it's needed"""
+        board = self._boards.get(guild_id)
+        if board is not None:
+            return board
+
+        task = self._loading.get(guild_id)
+        if task is None:
+            task = asyncio.create_task(self._load(guild_id))
+            self._loading[guild_id] = task
+            task.add_done_callback(lambda _: self._loading.pop(guild_id, None))
+        return await asyncio.shield(task)
+
+    async def _load(self, guild_id: int) -> GuildLeaderboard:
+        board = GuildLeaderboard()
+        for topic in await self.bot.db.fetch(queries.TOPICS_RANKING, guild_id):
+            board.set(topic["id"], topic["thread_id"], topic["priority_level"])
+        return self._boards.setdefault(guild_id, board)
+
+    async def _enabled(self, guild_id: int) -> bool:
+        """Whether a guild has a priority counting thread, boards are only kept for those that do"""
+        settings = await self.bot.settings_cache.get(guild_id)
+        if settings.priority_counting_thread:
+            return True
+        self.forget(guild_id)
+        return False
+
+    async def topic_added(
+        self, guild_id: int, topic_id: int, thread_id: int, priority: int
+    ) -> None:
+        if not await self._enabled(guild_id):
+            return
+        (await self.board(guild_id)).set(topic_id, thread_id, priority)
+        self.schedule_render(guild_id)
+
+    async def priority_changed(
+        self, guild_id: int, topic_id: int, priority: int
+    ) -> None:
+        if not await self._enabled(guild_id):
+            return
+        board = await self.board(guild_id)
+        if not board.set_priority(topic_id, priority):
+            # Topic predates the board being loaded, start over from the database
+            self._boards.pop(guild_id, None)
+        self.schedule_render(guild_id)
+
+    async def topic_removed(self, guild_id: int, topic_id: int) -> None:
+        if not await self._enabled(guild_id):
+            return
+        (await self.board(guild_id)).remove(topic_id)
+        self.schedule_render(guild_id)
+
+    def forget(self, guild_id: int) -> None:
+        """Drops a guild's ranking, for when its priority counting thread was unset"""
+        self._boards.pop(guild_id, None)
+
+    def reload(self, guild_id: int) -> None:
+        """Loads a guild's ranking from the database again, for when its topics were replaced wholesale"""
+        self._boards.pop(guild_id, None)
+        self.schedule_render(guild_id)
+
+    def schedule_render(self, guild_id: int) -> None:
+        """Renders the guild's leaderboard after the debounce delay, unless a render is already waiting"""
+        if guild_id in self._renders:
+            return
+        task = asyncio.create_task(self._delayed_render(guild_id))
+        self._renders[guild_id] = task
+
+    async def _delayed_render(self, guild_id: int) -> None:
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            # Events arriving from here on schedule a new render
+            self._renders.pop(guild_id, None)
+        try:
+            await self.render(guild_id)
+        except Exception:
+            # Nothing awaits this task, so database errors are logged here as well
+            self.bot.log.exception(f"Unable to render leaderboard for guild {guild_id}")
+
+    def format(self, board: GuildLeaderboard) -> str:
+        if not len(board):
+            return "**Topics by priority**\nNo open topics."
+        lines = ["**Topics by priority**"]
+        for rank, (thread_id, priority) in enumerate(board.top(self.size), start=1):
+            lines.append(f"{rank}. <#{thread_id}> - priority {priority}")
+        if len(board) > self.size:
+            lines.append(f"...and {len(board) - self.size} more")
+        return "\n".join(lines)
+
+    async def render(self, guild_id: int) -> None:
+        """Writes the ranking into the guild's priority counting thread"""
+        settings = await self.bot.settings_cache.get(guild_id)
+        if not settings.priority_counting_thread:
+            return
+        guild = self.bot.get_guild(guild_id)
+        if guild is None:
+            return
+        thread: Optional[discord.Thread] = guild.get_channel_or_thread(
+            settings.priority_counting_thread
+        )
+        if thread is None:
+            try:
+                thread = await guild.fetch_channel(settings.priority_counting_thread)
+            except discord.NotFound:
+                self.bot.log.warning(
+                    f"Priority counting thread for guild {guild.name} ({guild_id}) no longer exists"
+                )
+                return
+
+        content = self.format(await self.board(guild_id))
+        if settings.priority_message_id:
+            try:
+                message = thread.get_partial_message(settings.priority_message_id)
+                await self.bot.outbound.submit(
+                    thread.id,
+                    partial(message.edit, content=content),
+                    lane=Lane.COSMETIC,
+                    coalesce_key=("leaderboard", guild_id),
+                )
+                return
+            except discord.NotFound:
+                pass
+
+        message = await thread.send(content)
+        record = await self.bot.db.fetchrow(
+            queries.SETTINGS_SET_PRIORITY_MESSAGE, guild_id, message.id
+        )
+        self.bot.settings_cache.store(record)
@@ -0,0 +1,138 @@
+"""Queued logging.
+
+Loggers only put records on a bounded queue, a listener thread writes them to the console and one shared rotating file.
+A slow disk then never blocks the event loop. When the queue is full records are dropped and counted instead.
+"""
+
+from __future__ import annotations
+import atexit
+import json
+import logging
+import os
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from logzero import LogFormatter
+from typing import Optional
+
+LOG_PATH = "data/logs/"
+ROOT_LOGGER = "mmi"
+TEXT_FORMAT = "[%(levelname)1.1s %(asctime)s %(name)s] %(message)s"
+CONSOLE_FORMAT = (
+    "%(color)s[%(levelname)1.1s %(asctime)s %(name)s]%(end_color)s %(message)s"
+)
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Queue handler that counts records it could not queue instead of blocking"""
+
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._reported = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve the message and traceback now, the sink formats the rest on its own thread
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            if self.dropped > self._reported:
+                self.queue.put_nowait(self._dropped_record())
+                self._reported = self.dropped
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _dropped_record(self) -> logging.LogRecord:
+        return logging.makeLogRecord(
+            {
+                "name": ROOT_LOGGER,
+                "levelno": logging.WARNING,
+                "levelname": "WARNING",
+                "msg": f"Dropped {self.dropped - self._reported} log records, the log queue was full",
+            }
+        )
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # Wait for room so stopping never fails on a full queue
+        self.queue.put(self._sentinel)
+
+
+_handler: Optional[DroppingQueueHandler] = None
+_listener: Optional[QueueListener] = None
+
+
+def start_logging(
+    filename: str = "mmi",
+    max_bytes: int = 1_000_000,
+    backup_count: int = 5,
+    json_lines: bool = False,
+    queue_size: int = 10_000,
+) -> None:
+    """Starts the listener thread and routes every bot logger through the queue"""
+    global _handler, _listener
+    if _listener is not None:
+        return
+    if not os.path.isdir(LOG_PATH):
+        os.mkdir(LOG_PATH)
+
+    file_handler = RotatingFileHandler(
+        LOG_PATH + filename + (".jsonl" if json_lines else ".log"),
+        maxBytes=max_bytes,
+        backupCount=backup_count,
+        encoding="utf-8",
+    )
+    file_handler.setFormatter(
+        JsonFormatter() if json_lines else logging.Formatter(TEXT_FORMAT)
+    )
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(LogFormatter(fmt=CONSOLE_FORMAT))
+
+    log_queue: queue.Queue = queue.Queue(queue_size)
+    _handler = DroppingQueueHandler(log_queue)
+    _listener = _Listener(log_queue, console_handler, file_handler)
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(logging.DEBUG)
+    root.addHandler(_handler)
+    root.propagate = False
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Writes out everything still queued and stops the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def dropped_records() -> int:
+    return _handler.dropped if _handler is not None else 0
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
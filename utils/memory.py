@@ -0,0 +1,40 @@
+from __future__ import annotations
+import os
+from typing import TYPE_CHECKING, Dict, Optional
+
+if TYPE_CHECKING:
+    from main import ModMailInternal
+
+
+def rss_bytes() -> Optional[int]:
+    """Resident memory of this process, None where /proc isn't available"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE")
+
+
+def memory_report(bot: ModMailInternal) -> Dict[str, Optional[float]]:
+    """Resident memory next to what the gateway cache holds, to compare gateway modes"""
+    rss = rss_bytes()
+    guilds = len(bot.guilds)
+    return {
+        "rss_bytes": rss,
+        "guilds": guilds,
+        "cached_members": sum(len(g.members) for g in bot.guilds),
+        "cached_users": len(bot.users),
+        "rss_bytes_per_guild": rss / guilds if rss is not None and guilds else None,
+    }
+
+
+def format_report(report: Dict[str, Optional[float]], gateway_mode: str) -> str:
+    if report["rss_bytes"] is None:
+        return "Resident memory is only available on Linux."
+    per_guild = report["rss_bytes_per_guild"]
+    return (
+        f"RSS {report['rss_bytes'] / 2**20:.1f} MiB in {gateway_mode} mode for {report['guilds']} guilds"
+        + (f" ({per_guild / 2**10:.1f} KiB per guild)" if per_guild else "")
+        + f", {report['cached_members']} cached members, {report['cached_users']} cached users"
+    )
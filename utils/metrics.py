@@ -0,0 +1,257 @@
+from __future__ import annotations
+import functools
+import time
+import discord
+from aiohttp import web
+from utils.logs import dropped_records
+from utils.memory import rss_bytes
+from utils.topics import rows_fetched
+from contextlib import asynccontextmanager
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+if TYPE_CHECKING:
+    from main import ModMailInternal
+    from utils.db import StatementStats
+
+Labels = Tuple[Tuple[str, str], ...]
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 2, 3, 5, 10)
+
+
+def _format_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    """A Prometheus style histogram with one series per label set"""
+
+    def __init__(
+        self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        # labels -> (count per bucket, sum, count)
+        self._series: Dict[Labels, List[Any]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                bucket_labels = _format_labels(labels, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {bucket_count}")
+            bucket_labels = _format_labels(labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class Counter:
+    """A Prometheus style counter with one series per label set"""
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self._series: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        self._series[key] = self._series.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._series.items()):
+            lines.append(f"{self.name}{_format_labels(labels)} {value}")
+        return lines
+
+
+def _gauge(name: str, help: str, value: float) -> List[str]:
+    return [f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {value}"]
+
+
+def _statement_lines(stats: StatementStats) -> List[str]:
+    calls = Counter("mmi_statement_calls_total", "Database calls per statement")
+    seconds = Counter(
+        "mmi_statement_seconds_total", "Time spent in database calls per statement"
+    )
+    for name, count in stats.calls.items():
+        calls.inc(count, name=name)
+        seconds.inc(stats.seconds[name], name=name)
+    return calls.render() + seconds.render()
+
+
+class Metrics:
+    """Collects handler latencies, errors and pool statistics and renders them in the Prometheus text format"""
+
+    def __init__(self, bot: ModMailInternal) -> None:
+        self.bot = bot
+        self.handler_latency = Histogram(
+            "mmi_handler_latency_seconds",
+            "Time taken by app commands, buttons and modal submits",
+        )
+        self.handler_errors = Counter(
+            "mmi_handler_errors_total", "Handlers that raised an error"
+        )
+        self.pool_acquire_wait = Histogram(
+            "mmi_pool_acquire_wait_seconds",
+            "Time spent waiting for a database connection",
+            (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0),
+        )
+        self.topic_rows = Histogram(
+            "mmi_topic_rows_per_command",
+            "Topic rows read from the database per app command",
+            ROW_BUCKETS,
+        )
+        self._server: Optional[web.AppRunner] = None
+
+    @asynccontextmanager
+    async def timed(self, kind: str, name: str) -> AsyncIterator[None]:
+        """Records how long the body takes and whether it raised"""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.handler_errors.inc(kind=kind, name=name)
+            raise
+        finally:
+            self.handler_latency.observe(
+                time.perf_counter() - start, kind=kind, name=name
+            )
+
+    def command_started(self, interaction: discord.Interaction) -> None:
+        interaction.extras["started"] = time.perf_counter()
+
+    def command_finished(
+        self, interaction: discord.Interaction, failed: bool = False
+    ) -> None:
+        started = interaction.extras.get("started")
+        if started is None or interaction.command is None:
+            return
+        name = interaction.command.qualified_name
+        self.handler_latency.observe(
+            time.perf_counter() - started, kind="command", name=name
+        )
+        self.topic_rows.observe(rows_fetched(interaction), name=name)
+        if failed:
+            self.handler_errors.inc(kind="command", name=name)
+
+    def render(self) -> str:
+        lines = self.handler_latency.render()
+        lines += self.handler_errors.render()
+        lines += self.pool_acquire_wait.render()
+        lines += self.topic_rows.render()
+        db = getattr(self.bot, "db", None)
+        if db is not None:
+            lines += _statement_lines(db.stats)
+            size = db.get_size()
+            lines += _gauge("mmi_pool_size", "Open database connections", size)
+            lines += _gauge(
+                "mmi_pool_in_use",
+                "Database connections currently acquired",
+                size - db.get_idle_size(),
+            )
+            lines += _gauge(
+                "mmi_pool_max_size", "Maximum database connections", db.get_max_size()
+            )
+        latency = self.bot.latency
+        if latency == latency:  # NaN before the first heartbeat
+            lines += _gauge(
+                "mmi_gateway_latency_seconds", "Gateway heartbeat latency", latency
+            )
+        lines += _gauge(
+            "mmi_log_records_dropped",
+            "Log records dropped because the log queue was full",
+            dropped_records(),
+        )
+        rss = rss_bytes()
+        if rss is not None:
+            lines += _gauge("mmi_resident_memory_bytes", "Resident memory", rss)
+        lines += _gauge(
+            "mmi_cached_members",
+            "Members held in the gateway cache",
+            sum(len(g.members) for g in self.bot.guilds),
+        )
+        cache = self.bot.settings_cache.stats()
+        lines += _gauge("mmi_settings_cache_hits", "Settings cache hits", cache["hits"])
+        lines += _gauge(
+            "mmi_settings_cache_misses", "Settings cache misses", cache["misses"]
+        )
+        topics = self.bot.topics
+        lines += _gauge(
+            "mmi_topic_rows_fetched",
+            "Topic rows read from the database",
+            topics.rows_fetched,
+        )
+        lines += _gauge(
+            "mmi_topic_identity_hits",
+            "Topic reads answered by an interaction's identity map",
+            topics.identity_hits,
+        )
+        lines += _gauge(
+            "mmi_topic_cache_hits",
+            "Topic reads answered by the thread cache",
+            topics.cache.hits,
+        )
+        return "\n".join(lines) + "\n"
+
+    async def start_server(self, host: str, port: int) -> None:
+        """Serves the metrics on http://host:port/metrics"""
+
+        async def handle(request: web.Request) -> web.Response:
+            return web.Response(
+                text=self.render(), content_type="text/plain", charset="utf-8"
+            )
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        self._server = web.AppRunner(app, access_log=None)
+        await self._server.setup()
+        await web.TCPSite(self._server, host, port).start()
+
+    async def stop_server(self) -> None:
+        if self._server is not None:
+            await self._server.cleanup()
+            self._server = None
+
+
+def instrumented(kind: str, name: str) -> Callable:
+    """Records latency and errors for a handler whose second argument is the interaction"""
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            metrics: Optional[Metrics] = getattr(args[1].client, "metrics", None)
+            if metrics is None:
+                return await func(*args, **kwargs)
+            async with metrics.timed(kind, name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
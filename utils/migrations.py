@@ -0,0 +1,111 @@
+from __future__ import annotations
+import hashlib
+import os
+import re
+import asyncpg
+from logging import Logger
+from typing import List, NamedTuple
+
+MIGRATIONS_PATH = "migrations/"
+# Arbitrary key so only one bot process migrates a database at a time
+ADVISORY_LOCK_KEY = 0x4D4D49
+
+_FILENAME = re.compile(r"^(?P<version>\d+)_(?P<name>\w+)\.sql$")
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    path: str
+
+
+def discover_migrations(path: str = MIGRATIONS_PATH) -> List[Migration]:
+    """Finds all migration files, ordered by version"""
+    migrations = []
+    for filename in os.listdir(path):
+        match = _FILENAME.match(filename)
+        if not match:
+            continue
+        migrations.append(
+            Migration(
+                int(match["version"]), match["name"], os.path.join(path, filename)
+            )
+        )
+
+    migrations.sort()
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError("Two migrations share the same version number")
+    return migrations
+
+
+def migrations_checksum(migrations: List[Migration]) -> str:
+    """Hash over every migration file, it changes whenever one is added or edited"""
+    digest = hashlib.sha256()
+    for migration in migrations:
+        digest.update(f"{migration.version}:{migration.name}\n".encode())
+        with open(migration.path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+async def schema_is_current(con: asyncpg.Connection, checksum: str) -> bool:
+    """Whether the schema was last migrated with exactly these migration files.
+
+    A single query, so a restart with nothing to migrate doesn't have to take the migration lock.
+    Delete the row in schema_checksum to make the next start run the migrations again.
+    """
+    try:
+        stored = await con.fetchval("SELECT checksum FROM schema_checksum")
+    except asyncpg.UndefinedTableError:
+        return False
+    return stored == checksum
+
+
+async def run_migrations(
+    con: asyncpg.Connection, log: Logger, path: str = MIGRATIONS_PATH
+) -> List[Migration]:
+    """Applies every migration that hasn't been applied yet. Returns the ones that ran.
+
+    Everything happens in one transaction under an advisory lock, so either all pending migrations apply or none do.
+    """
+    migrations = discover_migrations(path)
+    applied = []
+    async with con.transaction():
+        await con.execute("SELECT pg_advisory_xact_lock($1)", ADVISORY_LOCK_KEY)
+        await con.execute(
+            """CREATE TABLE IF NOT EXISTS schema_version (
+                   version INT PRIMARY KEY,
+                   name TEXT NOT NULL,
+                   applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+               )"""
+        )
+        done = {
+            r["version"] for r in await con.fetch("SELECT version FROM schema_version")
+        }
+        for migration in migrations:
+            if migration.version in done:
+                continue
+            with open(migration.path, "r") as f:
+                await con.execute(f.read())
+            await con.execute(
+                "INSERT INTO schema_version (version, name) VALUES ($1, $2)",
+                migration.version,
+                migration.name,
+            )
+            log.info(f"Applied migration {migration.version:04} ({migration.name})")
+            applied.append(migration)
+
+        await con.execute(
+            """CREATE TABLE IF NOT EXISTS schema_checksum (
+                   id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+                   checksum TEXT NOT NULL
+               )"""
+        )
+        await con.execute(
+            """INSERT INTO schema_checksum (checksum) VALUES ($1)
+               ON CONFLICT (id) DO UPDATE SET checksum = EXCLUDED.checksum""",
+            migrations_checksum(migrations),
+        )
+
+    return applied
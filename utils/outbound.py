@@ -0,0 +1,118 @@
+from __future__ import annotations
+import asyncio
+import heapq
+import itertools
+from enum import IntEnum
+from logging import Logger
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+class Lane(IntEnum):
+    """Priority of an outbound action within its bucket, lower runs first"""
+
+    INTERACTION = 0
+    NORMAL = 1
+    COSMETIC = 2
+
+
+class _Action:
+    __slots__ = ("factory", "futures", "coalesce_key", "log_errors")
+
+    def __init__(
+        self,
+        factory: Callable[[], Awaitable[Any]],
+        coalesce_key: Optional[Hashable],
+    ) -> None:
+        self.factory = factory
+        self.futures: List[asyncio.Future[Any]] = []
+        self.coalesce_key = coalesce_key
+        self.log_errors = False
+
+
+class _Bucket:
+    __slots__ = ("queue", "coalescing", "task")
+
+    def __init__(self) -> None:
+        self.queue: List[Tuple[int, int, _Action]] = []
+        self.coalescing: Dict[Hashable, _Action] = {}
+        self.task: Optional[asyncio.Task[None]] = None
+
+
+class OutboundScheduler:
+    """Runs outgoing Discord REST calls one bucket at a time.
+
+    Actions sharing a bucket (usually the channel or thread they touch) run one after another, highest lane first and in
+    submission order within a lane, so bursts don't pile onto the same rate limit. Pending actions that share a coalesce key
+    are merged so only the newest one runs, e.g. several edits to the same message become one.
+    """
+
+    def __init__(self, log: Logger) -> None:
+        self.log = log
+        self.coalesced = 0
+        self._buckets: Dict[Hashable, _Bucket] = {}
+        self._counter = itertools.count()
+
+    def submit(
+        self,
+        bucket: Hashable,
+        factory: Callable[[], Awaitable[Any]],
+        *,
+        lane: Lane = Lane.NORMAL,
+        coalesce_key: Optional[Hashable] = None,
+        log_errors: bool = True,
+    ) -> asyncio.Future[Any]:
+        """Queues an action. The returned future resolves with its result, it doesn't have to be awaited.
+
+        Failures are logged unless `log_errors` is off, for callers that await the future and report the error themselves.
+        """
+        future = asyncio.get_running_loop().create_future()
+
+        queued = self._buckets.get(bucket)
+        if queued is None:
+            queued = self._buckets[bucket] = _Bucket()
+            queued.task = asyncio.create_task(self._drain(bucket, queued))
+
+        if coalesce_key is not None and coalesce_key in queued.coalescing:
+            # Replace the pending action's work with the newer one, everyone waiting gets the newer result
+            action = queued.coalescing[coalesce_key]
+            action.factory = factory
+            action.futures.append(future)
+            action.log_errors |= log_errors
+            self.coalesced += 1
+            return future
+
+        action = _Action(factory, coalesce_key)
+        action.futures.append(future)
+        action.log_errors = log_errors
+        if coalesce_key is not None:
+            queued.coalescing[coalesce_key] = action
+        heapq.heappush(queued.queue, (lane, next(self._counter), action))
+        return future
+
+    async def _drain(self, key: Hashable, bucket: _Bucket) -> None:
+        while bucket.queue:
+            _, _, action = heapq.heappop(bucket.queue)
+            if action.coalesce_key is not None:
+                bucket.coalescing.pop(action.coalesce_key, None)
+            try:
+                result = await action.factory()
+            except Exception as e:
+                for future in action.futures:
+                    if not future.done():
+                        future.set_exception(e)
+                        # Marks it retrieved, nobody has to await a fire-and-forget action
+                        future.exception()
+                if action.log_errors:
+                    # Once per action, however many submissions were coalesced into it
+                    self.log.error(
+                        "Outbound action failed",
+                        exc_info=(type(e), e, e.__traceback__),
+                    )
+            else:
+                for future in action.futures:
+                    if not future.done():
+                        future.set_result(result)
+        del self._buckets[key]
+
+    def pending(self) -> int:
+        return sum(len(b.queue) for b in self._buckets.values())
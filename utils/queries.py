@@ -0,0 +1,222 @@
+"""Every SQL statement the bot runs outside of migrations.
+
+Statements are passed to `utils.db.Database` by object, so each one is counted and timed under its name.
+Keeping the text fixed also means asyncpg's per-connection statement cache prepares each one only once.
+"""
+
+from typing import NamedTuple
+
+
+class Statement(NamedTuple):
+    name: str
+    sql: str
+
+
+# Settings
+SETTINGS_GET = Statement("settings.get", "SELECT * FROM settings WHERE guild_id = $1")
+SETTINGS_ENSURE = Statement(
+    "settings.ensure",
+    "INSERT INTO settings (guild_id) VALUES ($1) ON CONFLICT (guild_id) DO NOTHING",
+)
+SETTINGS_SET_CHANNEL = Statement(
+    "settings.set_channel",
+    "UPDATE settings SET output_channel_id = $2 WHERE guild_id = $1 RETURNING *",
+)
+SETTINGS_SET_PRIORITY_THREAD = Statement(
+    "settings.set_priority_thread",
+    """UPDATE settings SET priority_counting_thread = $2, priority_message_id = NULL
+       WHERE guild_id = $1 RETURNING *""",
+)
+SETTINGS_SET_PRIORITY_MESSAGE = Statement(
+    "settings.set_priority_message",
+    "UPDATE settings SET priority_message_id = $2 WHERE guild_id = $1 RETURNING *",
+)
+SETTINGS_ADD_ROLE = Statement(
+    "settings.add_role",
+    """UPDATE settings SET allowed_role_ids = array_append(
+           ARRAY(SELECT r FROM unnest(allowed_role_ids) r WHERE r <> ALL($3::BIGINT[])), $2
+       ) WHERE guild_id = $1 RETURNING *""",
+)
+SETTINGS_REMOVE_ROLES = Statement(
+    "settings.remove_roles",
+    """UPDATE settings SET allowed_role_ids = ARRAY(
+           SELECT r FROM unnest(allowed_role_ids) r WHERE r <> ALL($2::BIGINT[])
+       ) WHERE guild_id = $1 RETURNING *""",
+)
+
+# Topics
+TOPIC_CREATE = Statement(
+    "topic.create",
+    """WITH topic AS (
+           INSERT INTO topics (
+               id,
+               guild_id,
+               title,
+               message,
+               priority_level,
+               message_id,
+               author_id,
+               thread_id) VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+           RETURNING id, author_id
+       )
+       INSERT INTO topic_votes (topic_id, user_id) SELECT id, author_id FROM topic""",
+)
+# Every column but the vote count, which changes too often for the row to be cached
+TOPIC_GET = Statement(
+    "topic.get",
+    """SELECT id, guild_id, title, message, message_id, author_id, thread_id
+       FROM topics WHERE id = $1""",
+)
+TOPIC_ID_BY_MESSAGE = Statement(
+    "topic.id_by_message", "SELECT id FROM topics WHERE message_id = $1"
+)
+TOPIC_BY_THREAD = Statement(
+    "topic.by_thread",
+    """SELECT id, guild_id, title, message, message_id, author_id, thread_id
+       FROM topics WHERE guild_id = $1 AND thread_id = $2""",
+)
+TOPIC_CHOICES = Statement(
+    "topic.choices",
+    """SELECT thread_id, title FROM topics WHERE guild_id = $1
+       ORDER BY priority_level DESC LIMIT $2""",
+)
+TOPIC_CHOICES_BY_AUTHOR = Statement(
+    "topic.choices_by_author",
+    """SELECT thread_id, title FROM topics WHERE guild_id = $1 AND author_id = $2
+       ORDER BY priority_level DESC LIMIT $3""",
+)
+# A NULL title or message keeps the current one
+TOPIC_UPDATE = Statement(
+    "topic.update",
+    """UPDATE topics SET title = COALESCE($2, title), message = COALESCE($3, message)
+       WHERE id = $1""",
+)
+# Moves a topic with its voters into the archive, in one statement so it can't be half done
+TOPIC_ARCHIVE = Statement(
+    "topic.archive",
+    """WITH closed AS (
+           DELETE FROM topics WHERE id = $1 AND guild_id = $2 RETURNING *
+       )
+       INSERT INTO topics_archive (
+           id,
+           guild_id,
+           title,
+           message,
+           priority_level,
+           message_id,
+           author_id,
+           thread_id,
+           voter_ids,
+           closed_by,
+           closer_id,
+           remarks)
+       SELECT id, guild_id, title, message, priority_level, message_id, author_id, thread_id,
+              ARRAY(SELECT user_id FROM topic_votes WHERE topic_id = closed.id), $3, $4, $5
+       FROM closed
+       RETURNING priority_level, message_id""",
+)
+TOPICS_FOR_VIEWS = Statement(
+    "topics.for_views", "SELECT id, author_id, message_id FROM topics"
+)
+# Guilds are routed to shard (guild_id >> 22) % shard_count
+TOPICS_FOR_VIEWS_ON_SHARDS = Statement(
+    "topics.for_views_on_shards",
+    """SELECT id, author_id, message_id FROM topics
+       WHERE (guild_id >> 22) % $1 = ANY($2::INT[])""",
+)
+TOPICS_FOR_VIEWS_IN_GUILD = Statement(
+    "topics.for_views_in_guild",
+    "SELECT id, author_id, message_id FROM topics WHERE guild_id = $1",
+)
+# Keyset pagination on (rank, id), pass NULL for both to get the first page
+TOPICS_SEARCH = Statement(
+    "topics.search",
+    """SELECT id, title, thread_id, priority_level, rank FROM (
+           SELECT id, title, thread_id, priority_level, ts_rank(search, query) AS rank
+           FROM topics, websearch_to_tsquery('english', $2) query
+           WHERE guild_id = $1 AND search @@ query
+       ) matches
+       WHERE $3::REAL IS NULL OR (rank, id) < ($3::REAL, $4::BIGINT)
+       ORDER BY rank DESC, id DESC
+       LIMIT $5""",
+)
+# Keyset pagination on id for the reconciliation worker, pass 0 to start
+TOPICS_THREADS_PAGE = Statement(
+    "topics.threads_page",
+    """SELECT id, thread_id FROM topics WHERE guild_id = $1 AND id > $2
+       ORDER BY id LIMIT $3""",
+)
+TOPICS_RANKING = Statement(
+    "topics.ranking",
+    "SELECT id, thread_id, priority_level FROM topics WHERE guild_id = $1",
+)
+
+# Votes
+VOTE_ADD = Statement(
+    "vote.add",
+    """WITH vote AS (
+           INSERT INTO topic_votes (topic_id, user_id) VALUES ($1, $2)
+           ON CONFLICT DO NOTHING RETURNING topic_id
+       )
+       UPDATE topics SET priority_level = priority_level + 1
+       WHERE id = (SELECT topic_id FROM vote) RETURNING priority_level""",
+)
+# Always one row, topic_exists tells a closed topic apart from a user who hadn't voted
+VOTE_REMOVE = Statement(
+    "vote.remove",
+    """WITH vote AS (
+           DELETE FROM topic_votes WHERE topic_id = $1 AND user_id = $2
+           RETURNING topic_id
+       ), updated AS (
+           UPDATE topics SET priority_level = priority_level - 1
+           WHERE id = (SELECT topic_id FROM vote) RETURNING priority_level
+       )
+       SELECT EXISTS (SELECT 1 FROM topics WHERE id = $1) AS topic_exists,
+              (SELECT priority_level FROM updated) AS priority_level""",
+)
+# No row when the topic was closed or never existed
+VOTERS = Statement(
+    "vote.voters",
+    """SELECT ARRAY(SELECT user_id FROM topic_votes WHERE topic_id = topics.id) AS voter_ids
+       FROM topics WHERE id = $1""",
+)
+VOTE_INSERT = Statement(
+    "vote.insert",
+    """INSERT INTO topic_votes (topic_id, user_id)
+       SELECT $1, $2 WHERE EXISTS (SELECT 1 FROM topics WHERE id = $1)
+       ON CONFLICT DO NOTHING""",
+)
+VOTE_DELETE = Statement(
+    "vote.delete", "DELETE FROM topic_votes WHERE topic_id = $1 AND user_id = $2"
+)
+VOTE_RECOUNT = Statement(
+    "vote.recount",
+    """UPDATE topics SET priority_level = (
+           SELECT count(*) FROM topic_votes WHERE topic_id = topics.id
+       ) WHERE id = ANY($1::BIGINT[])""",
+)
+
+# Archive
+ARCHIVE_ENSURE_PARTITION = Statement(
+    "archive.ensure_partition", "SELECT ensure_topics_archive_partition($1)"
+)
+# Keyset pagination on (closed_at, id), pass NULL for both to get the first page
+ARCHIVE_HISTORY = Statement(
+    "archive.history",
+    """SELECT id, title, thread_id, priority_level, closed_by, remarks, closed_at
+       FROM topics_archive
+       WHERE guild_id = $1 AND ($2::TIMESTAMPTZ IS NULL OR (closed_at, id) < ($2, $3::BIGINT))
+       ORDER BY closed_at DESC, id DESC
+       LIMIT $4""",
+)
+
+# Command sync
+COMMAND_SYNC_GET = Statement(
+    "command_sync.get", "SELECT hash, payload FROM command_sync WHERE scope = $1"
+)
+COMMAND_SYNC_STORE = Statement(
+    "command_sync.store",
+    """INSERT INTO command_sync (scope, hash, payload) VALUES ($1, $2, $3)
+       ON CONFLICT (scope) DO UPDATE
+       SET hash = EXCLUDED.hash, payload = EXCLUDED.payload, synced_at = now()""",
+)
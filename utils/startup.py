@@ -0,0 +1,49 @@
+from __future__ import annotations
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+
+
+class StartupTimer:
+    """Times each phase of booting, from constructing the bot to the first interaction it can answer"""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+        self.ready_after: Optional[float] = None
+        self.first_interaction_after: Optional[float] = None
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def record(self, name: str, seconds: float) -> None:
+        """Adds a phase that was timed elsewhere, like one running in the background"""
+        self.phases.append((name, seconds))
+
+    def ready(self) -> bool:
+        """Marks the gateway as ready, returns False if it already was"""
+        if self.ready_after is not None:
+            return False
+        self.ready_after = self.elapsed()
+        return True
+
+    def first_interaction(self) -> bool:
+        """Marks the first interaction, returns False if there already was one"""
+        if self.first_interaction_after is not None:
+            return False
+        self.first_interaction_after = self.elapsed()
+        return True
+
+    def report(self) -> str:
+        parts = [f"{name} {seconds:.2f}s" for name, seconds in self.phases]
+        if self.ready_after is not None:
+            parts.append(f"ready after {self.ready_after:.2f}s")
+        return "Startup: " + ", ".join(parts)
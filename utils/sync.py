@@ -0,0 +1,137 @@
+from __future__ import annotations
+import discord
+import hashlib
+import json
+from discord import app_commands
+from utils import queries
+from typing import TYPE_CHECKING, Any, Dict, List, NamedTuple, Optional
+
+if TYPE_CHECKING:
+    from main import ModMailInternal
+
+# Stored scope of the global commands, guild scopes are the guild id
+GLOBAL_SCOPE = 0
+
+Payload = List[Dict[str, Any]]
+
+
+class SyncPlan(NamedTuple):
+    """What syncing a scope would send compared to what was last synced"""
+
+    scope: int
+    payload: Payload
+    hash: str
+    stored_hash: Optional[str]
+    changes: List[str]
+
+    @property
+    def needed(self) -> bool:
+        return self.hash != self.stored_hash
+
+
+def tree_payload(
+    tree: app_commands.CommandTree, guild: Optional[discord.abc.Snowflake] = None
+) -> Payload:
+    """The payload tree.sync would send for a scope, in a fixed order"""
+    payload = [command.to_dict(tree) for command in tree.get_commands(guild=guild)]
+    return sorted(payload, key=lambda command: (command["type"], command["name"]))
+
+
+def canonical_json(payload: Payload) -> str:
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"))
+
+
+def payload_hash(payload: Payload) -> str:
+    return hashlib.sha256(canonical_json(payload).encode()).hexdigest()
+
+
+def _flatten(payload: Payload, prefix: str = "") -> Dict[str, Dict[str, Any]]:
+    """Commands by qualified name, groups are listed without their subcommands and each subcommand on its own"""
+    commands = {}
+    for command in payload:
+        name = prefix + command["name"]
+        options = command.get("options", [])
+        # Option types 1 and 2 are subcommands and subcommand groups
+        subcommands = [o for o in options if o["type"] in (1, 2)]
+        if subcommands:
+            commands[name] = dict(command, options=[])
+            commands.update(_flatten(subcommands, name + " "))
+        else:
+            commands[name] = command
+    return commands
+
+
+def diff_payloads(old: Payload, new: Payload) -> List[str]:
+    """One line per command or subcommand added (+), removed (-) or changed (~)"""
+    before = _flatten(old)
+    after = _flatten(new)
+    changes = []
+    for name in sorted(before.keys() | after.keys()):
+        if name not in before:
+            changes.append(f"+ {name}")
+        elif name not in after:
+            changes.append(f"- {name}")
+        elif canonical_json([before[name]]) != canonical_json([after[name]]):
+            changes.append(f"~ {name}")
+    return changes
+
+
+class CommandSync:
+    """Syncs the command tree only when its payload differs from the last one synced, which is kept in Postgres.
+
+    Syncing is heavily rate limited by Discord, so comparing hashes first lets every deploy sync on startup for free.
+    """
+
+    def __init__(self, bot: ModMailInternal) -> None:
+        self.bot = bot
+
+    async def plan(self, guild: Optional[discord.abc.Snowflake] = None) -> SyncPlan:
+        scope = guild.id if guild is not None else GLOBAL_SCOPE
+        payload = tree_payload(self.bot.tree, guild)
+        stored = await self.bot.db.fetchrow(queries.COMMAND_SYNC_GET, scope)
+        stored_payload = json.loads(stored["payload"]) if stored else []
+        return SyncPlan(
+            scope,
+            payload,
+            payload_hash(payload),
+            stored["hash"] if stored else None,
+            diff_payloads(stored_payload, payload),
+        )
+
+    async def sync(
+        self, guild: Optional[discord.abc.Snowflake] = None, force: bool = False
+    ) -> Optional[List[app_commands.AppCommand]]:
+        """Syncs a scope if it changed since the last sync, or always with `force`. Returns None when skipped"""
+        plan = await self.plan(guild)
+        if not plan.needed and not force:
+            return None
+        synced = await self.bot.tree.sync(guild=guild)
+        try:
+            await self.record(plan)
+        except Exception:
+            # Discord has the new commands, but without the record the next start syncs them again
+            self.bot.log.exception(
+                f"Synced the commands of scope {plan.scope} but couldn't record it, they will be synced again next start"
+            )
+        return synced
+
+    async def record(self, plan: SyncPlan) -> None:
+        await self.bot.db.execute(
+            queries.COMMAND_SYNC_STORE,
+            plan.scope,
+            plan.hash,
+            canonical_json(plan.payload),
+        )
+
+    async def sync_on_startup(self) -> None:
+        """Syncs the global commands if they changed since the last deploy"""
+        try:
+            synced = await self.sync()
+        except Exception:
+            # Runs as a background task, planning reads Postgres so this covers database errors too
+            self.bot.log.exception("Unable to sync application commands on startup")
+            return
+        if synced is None:
+            self.bot.log.info("Application commands unchanged, skipped syncing")
+        else:
+            self.bot.log.info(f"Synced {len(synced)} changed application commands")
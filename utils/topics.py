@@ -0,0 +1,126 @@
+from __future__ import annotations
+import asyncpg
+import discord
+import math
+from utils import queries
+from utils.cache import TTLCache
+from typing import TYPE_CHECKING, Dict, Optional
+
+if TYPE_CHECKING:
+    from main import ModMailInternal
+
+# Keys in Interaction.extras
+_IDENTITY_MAP = "topics"
+_ROWS_FETCHED = "topic_rows_fetched"
+
+
+class TopicRecord:
+    """A topic row without its vote count, which changes too often to be worth keeping around"""
+
+    __slots__ = (
+        "id",
+        "guild_id",
+        "title",
+        "message",
+        "message_id",
+        "author_id",
+        "thread_id",
+    )
+
+    def __init__(
+        self,
+        id: int,
+        guild_id: int,
+        title: str,
+        message: str,
+        message_id: int,
+        author_id: int,
+        thread_id: int,
+    ) -> None:
+        self.id = id
+        self.guild_id = guild_id
+        self.title = title
+        self.message = message
+        self.message_id = message_id
+        self.author_id = author_id
+        self.thread_id = thread_id
+
+    @classmethod
+    def from_record(cls, record: asyncpg.Record) -> TopicRecord:
+        # TOPIC_GET and TOPIC_BY_THREAD select the columns in this order
+        return cls(*record)
+
+    def __repr__(self) -> str:
+        return f"<TopicRecord id={self.id} thread_id={self.thread_id}>"
+
+
+class TopicRepository:
+    """Reads topics as TopicRecords, each from a single row.
+
+    Every interaction gets an identity map in its extras, so a topic read once while handling it is reused
+    by whatever else runs for the same interaction. Topics are also kept per thread in an LRU cache,
+    which anything that edits or closes a topic has to `invalidate`.
+    """
+
+    def __init__(self, bot: ModMailInternal, maxsize: int = 4096) -> None:
+        self.bot = bot
+        # Nothing but edits and closes changes the cached columns, so entries don't need to expire
+        self.cache = TTLCache(math.inf, maxsize)
+        self.rows_fetched = 0
+        self.identity_hits = 0
+
+    def _identity_map(self, interaction: discord.Interaction) -> Dict[int, TopicRecord]:
+        return interaction.extras.setdefault(_IDENTITY_MAP, {})
+
+    def _remember(
+        self, interaction: discord.Interaction, topic: TopicRecord
+    ) -> TopicRecord:
+        self._identity_map(interaction)[topic.id] = topic
+        self.cache.set((topic.guild_id, topic.thread_id), topic)
+        return topic
+
+    def _fetched(self, interaction: discord.Interaction) -> None:
+        self.rows_fetched += 1
+        interaction.extras[_ROWS_FETCHED] = rows_fetched(interaction) + 1
+
+    async def get(
+        self, interaction: discord.Interaction, topic_id: int
+    ) -> Optional[TopicRecord]:
+        """Gets a topic by id"""
+        topic = self._identity_map(interaction).get(topic_id)
+        if topic is not None:
+            self.identity_hits += 1
+            return topic
+        record = await self.bot.db.fetchrow(queries.TOPIC_GET, topic_id)
+        if record is None:
+            return None
+        self._fetched(interaction)
+        return self._remember(interaction, TopicRecord.from_record(record))
+
+    async def by_thread(
+        self, interaction: discord.Interaction, thread_id: int
+    ) -> Optional[TopicRecord]:
+        """Gets the topic of a thread in the interaction's guild, None if the thread isn't a topic"""
+        topic = self.cache.get((interaction.guild_id, thread_id))
+        if topic is not None:
+            self._identity_map(interaction)[topic.id] = topic
+            return topic
+        record = await self.bot.db.fetchrow(
+            queries.TOPIC_BY_THREAD, interaction.guild_id, thread_id
+        )
+        if record is None:
+            return None
+        self._fetched(interaction)
+        return self._remember(interaction, TopicRecord.from_record(record))
+
+    def invalidate(self, guild_id: int, thread_id: Optional[int] = None) -> None:
+        """Drops a thread's topic, or every topic of a guild if no thread is given"""
+        if thread_id is None:
+            self.cache.discard_where(lambda key: key[0] == guild_id)
+        else:
+            self.cache.discard((guild_id, thread_id))
+
+
+def rows_fetched(interaction: discord.Interaction) -> int:
+    """How many topic rows have been read from the database while handling an interaction"""
+    return interaction.extras.get(_ROWS_FETCHED, 0)
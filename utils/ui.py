@@ -1,40 +1,223 @@
 from __future__ import annotations
-from typing import Any
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
 from discord.enums import ButtonStyle
 from discord.interactions import Interaction
 from discord.ui.item import Item
 import discord
-from discord.ui import View, Button, Modal, TextInput
+from discord.ui import View, Button, Modal, TextInput, DynamicItem
 import asyncpg
+import asyncio
+import re
+import time
 from typing import TYPE_CHECKING
+from utils import queries
 from utils.errors import ViewError
+from utils.outbound import Lane
+from utils.metrics import instrumented
+from utils.votes import TOPIC_CLOSED
+from functools import partial
 from typing import AsyncGenerator
 
 if TYPE_CHECKING:
     from main import ModMailInternal
+    from utils.db import Database
+
+
+async def topic_generator(
+    bot: ModMailInternal, batch_size: int, guild_id: Optional[int] = None
+) -> AsyncGenerator[List[asyncpg.Record]]:
+    """Async generator for topics, streamed in batches through a server side cursor"""
+    # Cursors only live inside a transaction
+    async with bot.db.transaction() as tr:
+        cluster = bot.cluster
+        if guild_id is not None:
+            cursor = await tr.cursor(queries.TOPICS_FOR_VIEWS_IN_GUILD, guild_id)
+        elif cluster.shard_ids:
+            # Only this cluster's guilds, the other clusters restore their own
+            cursor = await tr.cursor(
+                queries.TOPICS_FOR_VIEWS_ON_SHARDS,
+                cluster.shard_count,
+                list(cluster.shard_ids),
+            )
+        else:
+            cursor = await tr.cursor(queries.TOPICS_FOR_VIEWS)
+        while batch := await cursor.fetch(batch_size):
+            yield batch
+
+
+def register_views(bot: ModMailInternal) -> None:
+    """Registers the handlers topic buttons go through, before the bot connects"""
+    # Every topic posted with dynamic buttons is handled by this one registration
+    bot.add_dynamic_items(TopicButton)
+    # A single persistent view without a message id catches buttons posted under the old custom_id scheme.
+    # In legacy view mode it also answers buttons whose view recreate_views hasn't added yet.
+    bot.add_view(TopicView(bot))
+
+
+async def recreate_views(bot: ModMailInternal, guild_id: Optional[int] = None):
+    """Adds a view per topic message in legacy view mode, so they survive reboots.
+
+    With a guild id only that guild's views are added again, for after its topics were restored from a backup.
+    """
+    if bot.view_mode == "dynamic":
+        return
+
+    start = time.perf_counter()
+    restored = 0
+    async for batch in topic_generator(bot, bot.view_restore_batch_size, guild_id):
+        for topic in batch:
+            topic_id = topic["id"]
+            author_id = topic["author_id"]
+            message_id = topic["message_id"]
+            view = TopicView(bot, author_id, topic_id)
+            bot.add_view(view, message_id=message_id)
+
+        restored += len(batch)
+        bot.log.info(
+            f"Restored {restored} topic views ({time.perf_counter() - start:.2f}s)"
+        )
+        # Let the gateway heartbeat and other tasks run between batches
+        await asyncio.sleep(0)
+
+    bot.log.info(
+        f"Finished restoring {restored} topic views in {time.perf_counter() - start:.2f}s"
+    )
+
+
+def make_topic_view(bot: ModMailInternal, author_id: int, topic_id: int) -> View:
+    """Makes the view to send with a new topic's first message, based on the configured view mode"""
+    if bot.view_mode == "legacy":
+        return TopicView(bot, author_id, topic_id)
+
+    view = View(timeout=None)
+    for action in TopicButton.BUTTONS:
+        view.add_item(TopicButton(action, topic_id))
+    return view
+
+
+async def add_priority(
+    bot: ModMailInternal, interaction: discord.Interaction, topic_id: int
+):
+    """Lets a user add priority to a topic"""
+    if bot.votes is not None:
+        priority_level = await bot.votes.add(topic_id, interaction.user.id)
+    else:
+        # Only bumps the priority when the vote row was actually inserted
+        try:
+            priority_level = await bot.db.fetchval(
+                queries.VOTE_ADD, topic_id, interaction.user.id
+            )
+        except asyncpg.ForeignKeyViolationError:
+            priority_level = TOPIC_CLOSED
+    if priority_level == TOPIC_CLOSED:
+        return await interaction.response.send_message(
+            "This topic has been closed.", ephemeral=True
+        )
+    if priority_level is None:
+        return await interaction.response.send_message(
+            "You have already increased priority for this topic.",
+            ephemeral=True,
+        )
+
+    await interaction.response.send_message(
+        "Increased priority for this topic.", ephemeral=True
+    )
+    await bot.leaderboards.priority_changed(
+        interaction.guild_id, topic_id, priority_level
+    )
+
+
+async def remove_priority(
+    bot: ModMailInternal, interaction: discord.Interaction, topic_id: int
+):
+    """Remove yourself from the priority list"""
+    if bot.votes is not None:
+        priority_level = await bot.votes.remove(topic_id, interaction.user.id)
+    else:
+        # Only lowers the priority when a vote row was actually deleted
+        result = await bot.db.fetchrow(
+            queries.VOTE_REMOVE, topic_id, interaction.user.id
+        )
+        if result["topic_exists"]:
+            priority_level = result["priority_level"]
+        else:
+            priority_level = TOPIC_CLOSED
+    if priority_level == TOPIC_CLOSED:
+        return await interaction.response.send_message(
+            "This topic has been closed.", ephemeral=True
+        )
+    if priority_level is None:
+        return await interaction.response.send_message(
+            "You have not increased priority for this topic and cannot remove yourself.",
+            ephemeral=True,
+        )
+
+    await interaction.response.send_message(
+        "Removed priority for this topic,", ephemeral=True
+    )
+    await bot.leaderboards.priority_changed(
+        interaction.guild_id, topic_id, priority_level
+    )
 
 
-async def topic_generator(bot: ModMailInternal) -> AsyncGenerator[asyncpg.Record]:
-    """Async generator for topics"""
-    for topic in await bot.db.fetch("SELECT id, author_id, message_id FROM topics"):
-        yield topic
+class TopicButton(
+    DynamicItem[Button],
+    template=r"topic:(?P<action>add|remove|edit):(?P<topic_id>[0-9]+)",
+):
+    """A stateless button for a topic's message.
+
+    The action and topic id live in the custom id, so one registered handler serves every topic without a view per message.
+    """
+
+    BUTTONS = {
+        "add": (ButtonStyle.green, "Give Priority", "\U00002b06"),
+        "remove": (ButtonStyle.red, "Remove Priority", "\U0000274c"),
+        "edit": (ButtonStyle.primary, "Edit", "\U0001f4dd"),
+    }
+
+    def __init__(self, action: str, topic_id: int) -> None:
+        style, label, emoji = self.BUTTONS[action]
+        super().__init__(
+            Button(
+                style=style,
+                label=label,
+                emoji=emoji,
+                custom_id=f"topic:{action}:{topic_id}",
+            )
+        )
+        self.action = action
+        self.topic_id = topic_id
 
+    @classmethod
+    async def from_custom_id(
+        cls, interaction: Interaction, item: Button, match: re.Match[str]
+    ) -> TopicButton:
+        return cls(match["action"], int(match["topic_id"]))
 
-async def recreate_views(bot: ModMailInternal):
-    """Recreates views on boot so they survive reboots."""
-    topics = topic_generator(bot)
-    async for topic in topics:
-        topic_id = topic["id"]
-        author_id = topic["author_id"]
-        message_id = topic["message_id"]
-        view = TopicView(bot, author_id, topic_id)
-        bot.add_view(view, message_id=message_id)
+    async def callback(self, interaction: Interaction) -> None:
+        bot: ModMailInternal = interaction.client
+        async with bot.metrics.timed("button", self.action):
+            if self.action == "add":
+                await add_priority(bot, interaction, self.topic_id)
+            elif self.action == "remove":
+                await remove_priority(bot, interaction, self.topic_id)
+            else:
+                await edit_topic(bot, interaction, self.topic_id)
 
 
 class TopicView(View):
-    """A view to accompany a topic's message for buttons."""
+    """A view to accompany a topic's message for buttons.
+
+    Used per message in legacy view mode. Without a topic id it acts as the catch-all for messages posted under the old custom_id scheme
+    and looks the topic up from the message instead.
+    """
 
-    def __init__(self, bot: ModMailInternal, author_id: int, topic_id: int):
+    def __init__(
+        self,
+        bot: ModMailInternal,
+        author_id: Optional[int] = None,
+        topic_id: Optional[int] = None,
+    ):
         super().__init__(timeout=None)
         self.bot = bot
         self.author_id = author_id
@@ -46,38 +229,32 @@ class TopicView(View):
     ) -> None:
         raise ViewError(interaction.command, error)
 
+    async def resolve_topic_id(self, interaction: discord.Interaction) -> Optional[int]:
+        """Gets the topic id for the message the button was pressed on"""
+        if self.topic_id is not None:
+            return self.topic_id
+
+        topic_id = await self.bot.db.fetchval(
+            queries.TOPIC_ID_BY_MESSAGE, interaction.message.id
+        )
+        if topic_id is None:
+            await interaction.response.send_message(
+                "This topic no longer exists.", ephemeral=True
+            )
+        return topic_id
+
     @discord.ui.button(
         style=ButtonStyle.green,
         label="Give Priority",
         custom_id="add",
         emoji="\U00002b06",
     )
+    @instrumented("button", "add")
     async def add_priority(self, interaction: discord.Interaction, button: Button):
         """Lets a user add priority to a topic"""
-        con: asyncpg.Connection
-        async with self.bot.db.acquire() as con:
-            users_in_favor = await con.fetchval(
-                "SELECT users_in_favor FROM topics WHERE id = $1",
-                self.topic_id,
-            )
-            if interaction.user.id in users_in_favor:
-                return await interaction.response.send_message(
-                    "You have already increased priority for this topic.",
-                    ephemeral=True,
-                )
-            await con.execute(
-                "UPDATE topics SET priority_level = priority_level + 1 WHERE id = $1",
-                self.topic_id,
-            )
-            await con.execute(
-                "UPDATE topics SET users_in_favor = array_append(users_in_favor, $1) WHERE id = $2",
-                interaction.user.id,
-                self.topic_id,
-            )
-
-        await interaction.response.send_message(
-            "Increased priority for this topic.", ephemeral=True
-        )
+        topic_id = await self.resolve_topic_id(interaction)
+        if topic_id is not None:
+            await add_priority(self.bot, interaction, topic_id)
 
     @discord.ui.button(
         style=ButtonStyle.red,
@@ -85,39 +262,22 @@ class TopicView(View):
         custom_id="remove",
         emoji="\U0000274c",
     )
+    @instrumented("button", "remove")
     async def remove_priority(self, interaction: discord.Interaction, button: Button):
         """Remove yourself from the priority list"""
-        con: asyncpg.Connection
-        async with self.bot.db.acquire() as con:
-            users_in_favor = await con.fetchval(
-                "SELECT users_in_favor FROM topics WHERE id = $1",
-                self.topic_id,
-            )
-            if interaction.user.id not in users_in_favor:
-                return await interaction.response.send_message(
-                    "You have not increased priority for this topic and cannot remove yourself.",
-                    ephemeral=True,
-                )
-            await con.execute(
-                "UPDATE topics SET priority_level = priority_level - 1 WHERE id = $1",
-                self.topic_id,
-            )
-            await con.execute(
-                "UPDATE topics SET users_in_favor = array_remove(users_in_favor, $1) WHERE id = $2",
-                interaction.user.id,
-                self.topic_id,
-            )
-
-        await interaction.response.send_message(
-            "Removed priority for this topic,", ephemeral=True
-        )
+        topic_id = await self.resolve_topic_id(interaction)
+        if topic_id is not None:
+            await remove_priority(self.bot, interaction, topic_id)
 
     @discord.ui.button(
         style=ButtonStyle.primary, label="Edit", custom_id="edit", emoji="\U0001f4dd"
     )
+    @instrumented("button", "edit")
     async def edit_message(self, interaction: discord.Interaction, button: Button):
         """Allows editing from a button."""
-        await edit_topic(self.bot, interaction, self.topic_id)
+        topic_id = await self.resolve_topic_id(interaction)
+        if topic_id is not None:
+            await edit_topic(self.bot, interaction, topic_id)
 
 
 async def edit_topic(
@@ -128,30 +288,29 @@ async def edit_topic(
     thread: discord.Thread = None,
 ):
     """Edits a topic message"""
-    if not thread:
-        con: asyncpg.Connection
-        async with bot.db.acquire() as con:
-            author_id = await con.fetchval(
-                "SELECT author_id FROM topics WHERE id = $1", topic_id
-            )
-            if author_id != interaction.user.id:
-                return await interaction.response.send_message(
-                    "You are not the author of this topic and cannot use this.",
-                    ephemeral=True,
-                )
-
-            thread_id = await con.fetchval(
-                "SELECT thread_id FROM topics WHERE id = $1", topic_id
-            )
-            message_id = await con.fetchval(
-                "SELECT message_id FROM topics WHERE id = $1", topic_id
-            )
+    # Already read if the command resolved the topic from its thread
+    topic = await bot.topics.get(interaction, topic_id)
+    if topic is None:
+        return await interaction.response.send_message(
+            "This topic no longer exists.", ephemeral=True
+        )
+    if topic.author_id != interaction.user.id:
+        return await interaction.response.send_message(
+            "You are not the author of this topic and cannot use this.",
+            ephemeral=True,
+        )
 
-        thread: discord.Thread = interaction.guild.get_channel_or_thread(thread_id)
+    if not thread:
+        if interaction.channel_id == topic.thread_id:
+            thread = interaction.channel
+        else:
+            thread = interaction.guild.get_channel_or_thread(topic.thread_id)
         if not thread:
-            raise ValueError("This shouldn't happen. Thread doesn't exist")
+            return await interaction.response.send_message(
+                "This topic's thread no longer exists.", ephemeral=True
+            )
 
-    partial_message = thread.get_partial_message(message_id)
+    partial_message = thread.get_partial_message(topic.message_id)
     model = EditingModal(bot.db, thread, partial_message, topic_id)
     await interaction.response.send_modal(model)
 
@@ -169,14 +328,18 @@ class MMIModal(Modal):
 class EditingModal(MMIModal):
     """A Modal to manage the topic editing feature."""
 
-    topic_title = TextInput(label="Topic Title", required=False)
+    # Discord's limits for thread names and message content
+    topic_title = TextInput(label="Topic Title", required=False, max_length=100)
     topic_message = TextInput(
-        label="Topic Message", style=discord.TextStyle.paragraph, required=False
+        label="Topic Message",
+        style=discord.TextStyle.paragraph,
+        required=False,
+        max_length=2000,
     )
 
     def __init__(
         self,
-        db: asyncpg.Pool,
+        db: Database,
         topic_thread: discord.Thread,
         message: discord.PartialMessage,
         topic_id: int,
@@ -187,26 +350,64 @@ class EditingModal(MMIModal):
         self.topic_id = topic_id
         super().__init__(title="Editing topic", timeout=None)
 
+    @instrumented("modal", "edit")
     async def on_submit(self, interaction: discord.Interaction):
-        if not self.topic_title.value.isspace():
-            await self.topic_thread.edit(name=self.topic_title)
+        bot: ModMailInternal = interaction.client
+        has_title = bool(self.topic_title.value.strip())
+        has_message = bool(self.topic_message.value.strip())
+        if not has_title and not has_message:
+            return await interaction.response.send_message("Cancelled", ephemeral=True)
+
+        # The edits run ahead of other queued work on the thread, the user hears how they went
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        bucket = self.topic_thread.id
+        edits = {}
+        if has_title:
+            edits["title"] = bot.outbound.submit(
+                bucket,
+                partial(self.topic_thread.edit, name=self.topic_title.value),
+                lane=Lane.INTERACTION,
+                coalesce_key=("thread_name", self.topic_thread.id),
+                log_errors=False,
+            )
+        if has_message:
+            edits["message"] = bot.outbound.submit(
+                bucket,
+                partial(self.message.edit, content=self.topic_message.value),
+                lane=Lane.INTERACTION,
+                coalesce_key=("message", self.message.id),
+                log_errors=False,
+            )
+        results = dict(
+            zip(edits, await asyncio.gather(*edits.values(), return_exceptions=True))
+        )
+        failures = [r for r in results.values() if isinstance(r, Exception)]
+        # Only what Discord accepted is stored, so the row keeps matching the thread
+        title_edited = has_title and not isinstance(results["title"], Exception)
+        message_edited = has_message and not isinstance(results["message"], Exception)
 
-        if not self.topic_message.value.isspace():
-            await self.message.edit(content=self.topic_message)
+        if title_edited or message_edited:
+            # The title is stored as well so searches find the topic under its new name
             await self.db.execute(
-                "UPDATE topics SET message = $1 WHERE id = $2",
-                str(self.topic_message),
+                queries.TOPIC_UPDATE,
                 self.topic_id,
+                self.topic_title.value if title_edited else None,
+                self.topic_message.value if message_edited else None,
             )
+            bot.topics.invalidate(interaction.guild_id, self.topic_thread.id)
+            if title_edited:
+                bot.topic_choices.invalidate(interaction.guild_id)
+        if failures:
+            return await interaction.followup.send(
+                f"Unable to edit the topic: {failures[0]}", ephemeral=True
+            )
+        await interaction.followup.send("Edited message.", ephemeral=True)
 
-        if (
-            not self.topic_title.value.isspace()
-            or not self.topic_message.value.isspace()
-        ):
-            await self.message.reply("Topic has been updated by original poster.")
-            await interaction.response.send_message("Edited message.", ephemeral=True)
-        else:
-            await interaction.response.send_message("Cancelled", ephemeral=True)
+        bot.outbound.submit(
+            bucket,
+            partial(self.message.reply, "Topic has been updated by original poster."),
+            lane=Lane.COSMETIC,
+        )
 
 
 class ClosingModal(MMIModal):
@@ -217,7 +418,7 @@ class ClosingModal(MMIModal):
     )
 
     def __init__(
-        self, db: asyncpg.Pool, topic_thread: discord.Thread, topic_id: int, closer: str
+        self, db: Database, topic_thread: discord.Thread, topic_id: int, closer: str
     ) -> None:
         self.db = db
         self.topic_id = topic_id
@@ -227,11 +428,25 @@ class ClosingModal(MMIModal):
             raise AttributeError("Invalid closer type.")
         super().__init__(title="Closing topic", timeout=None)
 
+    @instrumented("modal", "close")
     async def on_submit(self, interaction: Interaction) -> None:
+        bot: ModMailInternal = interaction.client
+        await interaction.response.defer()
+        if bot.votes is not None:
+            # Make sure the final priority includes votes that are still buffered
+            await bot.votes.flush()
         topic_entry = await self.db.fetchrow(
-            "SELECT priority_level, message_id FROM topics WHERE id = $1",
+            queries.TOPIC_ARCHIVE,
             self.topic_id,
+            interaction.guild_id,
+            self.closer,
+            interaction.user.id,
+            self.conclusion_text.value,
         )
+        if topic_entry is None:
+            return await interaction.followup.send(
+                "This topic has already been closed.", ephemeral=True
+            )
 
         if self.closer == "op":
             emb_description = "This topic was closed by the original poster."
@@ -246,15 +461,102 @@ class ClosingModal(MMIModal):
         )
         result_embed.set_footer(text=f"Priority level: {topic_entry['priority_level']}")
         message = self.topic_thread.get_partial_message(topic_entry["message_id"])
-        await message.reply(embed=result_embed)
-        # lock and archive thread.
-        await self.topic_thread.edit(
-            locked=True, archived=True, reason="Topic closed by " + self.closer
+        # Both share the thread's bucket and lane, so the reply lands before the thread is locked and archived.
+        bot.outbound.submit(
+            self.topic_thread.id,
+            partial(message.reply, embed=result_embed),
+            lane=Lane.INTERACTION,
+        )
+        bot.outbound.submit(
+            self.topic_thread.id,
+            partial(
+                self.topic_thread.edit,
+                locked=True,
+                archived=True,
+                reason="Topic closed by " + self.closer,
+            ),
+            lane=Lane.INTERACTION,
         )
 
-        await self.db.execute(
-            "DELETE FROM topics WHERE id = $1 AND guild_id = $2",
-            self.topic_id,
-            interaction.guild_id,
+        if bot.votes is not None:
+            bot.votes.forget(self.topic_id)
+        bot.topics.invalidate(interaction.guild_id, self.topic_thread.id)
+        bot.topic_choices.invalidate(interaction.guild_id)
+        await bot.leaderboards.topic_removed(interaction.guild_id, self.topic_id)
+
+
+class KeysetPaginator(View):
+    """Ephemeral pages of rows, each page fetched on demand after the last row of the one before it.
+
+    `fetch(after, limit)` gets up to `limit` rows that sort after the key `after`, or the first rows when it's None.
+    `key(row)` gives the key of a row and `render(rows, page)` builds the embed of a page.
+    """
+
+    def __init__(
+        self,
+        owner_id: int,
+        fetch: Callable[[Optional[Tuple], int], Awaitable[List[asyncpg.Record]]],
+        key: Callable[[asyncpg.Record], Tuple],
+        render: Callable[[List[asyncpg.Record], int], discord.Embed],
+        page_size: int = 10,
+    ) -> None:
+        super().__init__(timeout=300)
+        self.owner_id = owner_id
+        self.fetch = fetch
+        self.key = key
+        self.render = render
+        self.page_size = page_size
+        # The key each visited page starts after, the last one is the current page
+        self.starts: List[Optional[Tuple]] = [None]
+        self.rows: List[asyncpg.Record] = []
+        self.has_more = False
+        self.interaction: Optional[discord.Interaction] = None
+
+    async def load(self) -> None:
+        # One extra row tells whether there is a next page
+        rows = await self.fetch(self.starts[-1], self.page_size + 1)
+        self.rows = rows[: self.page_size]
+        self.has_more = len(rows) > self.page_size
+        self.previous_page.disabled = len(self.starts) == 1
+        self.next_page.disabled = not self.has_more
+
+    async def start(self, interaction: discord.Interaction, empty_message: str) -> None:
+        """Sends the first page, or `empty_message` if there are no rows at all"""
+        await self.load()
+        if not self.rows:
+            return await interaction.response.send_message(
+                empty_message, ephemeral=True
+            )
+        self.interaction = interaction
+        await interaction.response.send_message(
+            embed=self.render(self.rows, 0),
+            view=self if self.has_more else discord.utils.MISSING,
+            ephemeral=True,
         )
-        await interaction.response.defer()
+
+    async def show(self, interaction: discord.Interaction) -> None:
+        await self.load()
+        await interaction.response.edit_message(
+            embed=self.render(self.rows, len(self.starts) - 1), view=self
+        )
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.owner_id
+
+    async def on_timeout(self) -> None:
+        if self.interaction is not None:
+            try:
+                await self.interaction.edit_original_response(view=None)
+            except discord.HTTPException:
+                pass
+
+    @discord.ui.button(label="Previous", style=ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: Button):
+        if len(self.starts) > 1:
+            self.starts.pop()
+        await self.show(interaction)
+
+    @discord.ui.button(label="Next", style=ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: Button):
+        self.starts.append(self.key(self.rows[-1]))
+        await self.show(interaction)
@@ -0,0 +1,174 @@
+from __future__ import annotations
+import asyncio
+import time
+from collections import OrderedDict
+from utils import queries
+from typing import TYPE_CHECKING, Dict, Optional, Set, Tuple
+
+if TYPE_CHECKING:
+    from main import ModMailInternal
+
+Vote = Tuple[int, int]  # (topic id, user id)
+
+# Returned by add and remove when the topic was closed or never existed
+TOPIC_CLOSED = -1
+
+
+class VoteBuffer:
+    """Write-behind buffer for priority votes.
+
+    Each topic's voters are loaded once and kept in memory as the authoritative set, so duplicate votes are caught without a query.
+    Changes are answered right away and written to the database in batches every `interval` seconds and when the bot shuts down.
+    Voters without pending changes are dropped after `ttl` seconds or past `maxsize` topics, so topics closed elsewhere don't linger.
+    """
+
+    def __init__(
+        self,
+        bot: ModMailInternal,
+        interval: float,
+        ttl: float = 600.0,
+        maxsize: int = 10_000,
+    ) -> None:
+        self.bot = bot
+        self.interval = interval
+        self.ttl = ttl
+        self.maxsize = maxsize
+        # topic id -> (loaded at, voters), oldest use first
+        self._voters: OrderedDict[int, Tuple[float, Set[int]]] = OrderedDict()
+        self._loading: Dict[int, asyncio.Task[Optional[Set[int]]]] = {}
+        self._added: Set[Vote] = set()
+        self._removed: Set[Vote] = set()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task[None]] = None
+
+    async def voters(self, topic_id: int) -> Optional[Set[int]]:
+        """Gets the users in favor of a topic, loading them the first time. None if the topic doesn't exist"""
+        entry = self._voters.get(topic_id)
+        if entry is not None:
+            self._voters.move_to_end(topic_id)
+            return entry[1]
+
+        task = self._loading.get(topic_id)
+        if task is None:
+            task = asyncio.create_task(self._load(topic_id))
+            self._loading[topic_id] = task
+            task.add_done_callback(lambda _: self._loading.pop(topic_id, None))
+        return await asyncio.shield(task)
+
+    async def _load(self, topic_id: int) -> Optional[Set[int]]:
+        record = await self.bot.db.fetchrow(queries.VOTERS, topic_id)
+        if record is None:
+            return None
+        entry = self._voters.setdefault(
+            topic_id, (time.monotonic(), set(record["voter_ids"]))
+        )
+        return entry[1]
+
+    def _pending(self) -> Set[int]:
+        return {v[0] for v in self._added | self._removed}
+
+    def evict(self) -> None:
+        """Drops expired voters and the least recently used past `maxsize`, keeping topics with unflushed votes"""
+        pending = self._pending()
+        expired = time.monotonic() - self.ttl
+        for topic_id, (loaded_at, _) in list(self._voters.items()):
+            if loaded_at < expired and topic_id not in pending:
+                del self._voters[topic_id]
+        for topic_id in list(self._voters):
+            if len(self._voters) <= self.maxsize:
+                break
+            if topic_id not in pending:
+                del self._voters[topic_id]
+
+    async def add(self, topic_id: int, user_id: int) -> Optional[int]:
+        """Adds a vote. Returns the new priority, None if the user already voted or TOPIC_CLOSED"""
+        voters = await self.voters(topic_id)
+        if voters is None:
+            return TOPIC_CLOSED
+        if user_id in voters:
+            return None
+        voters.add(user_id)
+        vote = (topic_id, user_id)
+        if vote in self._removed:
+            self._removed.discard(vote)
+        else:
+            self._added.add(vote)
+        return len(voters)
+
+    async def remove(self, topic_id: int, user_id: int) -> Optional[int]:
+        """Removes a vote. Returns the new priority, None if the user hadn't voted or TOPIC_CLOSED"""
+        voters = await self.voters(topic_id)
+        if voters is None:
+            return TOPIC_CLOSED
+        if user_id not in voters:
+            return None
+        voters.discard(user_id)
+        vote = (topic_id, user_id)
+        if vote in self._added:
+            self._added.discard(vote)
+        else:
+            self._removed.add(vote)
+        return len(voters)
+
+    def forget(self, topic_id: int) -> None:
+        """Drops a topic's voters from memory, for topics that have been closed"""
+        self._voters.pop(topic_id, None)
+        self._added = {v for v in self._added if v[0] != topic_id}
+        self._removed = {v for v in self._removed if v[0] != topic_id}
+
+    def forget_all(self) -> None:
+        """Drops every cached set of voters, for when votes were replaced in the database. Flush first"""
+        self._voters.clear()
+
+    async def flush(self) -> None:
+        """Writes all pending votes to the database in one transaction"""
+        async with self._flush_lock:
+            if not self._added and not self._removed:
+                return
+            added, self._added = self._added, set()
+            removed, self._removed = self._removed, set()
+            topic_ids = list({v[0] for v in added | removed})
+            try:
+                async with self.bot.db.transaction() as tr:
+                    if removed:
+                        await tr.executemany(queries.VOTE_DELETE, removed)
+                    if added:
+                        # Skips topics that were closed between the vote and the flush
+                        await tr.executemany(queries.VOTE_INSERT, added)
+                    await tr.execute(queries.VOTE_RECOUNT, topic_ids)
+            except Exception:
+                self._requeue(added, removed)
+                raise
+
+    def _requeue(self, added: Set[Vote], removed: Set[Vote]) -> None:
+        """Puts votes from a failed flush back, cancelling out anything that was undone in the meantime"""
+        for vote in added:
+            if vote in self._removed:
+                self._removed.discard(vote)
+            else:
+                self._added.add(vote)
+        for vote in removed:
+            if vote in self._added:
+                self._added.discard(vote)
+            else:
+                self._removed.add(vote)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception:
+                self.bot.log.exception("Unable to flush buffered votes, will retry")
+            self.evict()
+
+    async def stop(self) -> None:
+        """Stops the periodic flush and writes out whatever is left"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()